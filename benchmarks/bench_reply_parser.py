@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+#
+# Micro-benchmark of the reply parser of the TclServer socket protocol.
+#
+# Measures the cost per reply of RecvBuffer and _parse_reply() for small and
+# large replies, without any network involved.
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyixia.tclproto import RecvBuffer, _parse_reply  # noqa: E402
+
+
+class FakeSocket:
+    """Returns the same data over and over again."""
+    def __init__(self, data, chunk_size=65536):
+        self.data = memoryview(data)
+        self.chunk_size = chunk_size
+        self.pos = 0
+
+    def recv_into(self, buf):
+        n = min(len(buf), self.chunk_size, len(self.data) - self.pos)
+        buf[:n] = self.data[self.pos:self.pos+n]
+        self.pos += n
+        if self.pos == len(self.data):
+            self.pos = 0
+        return n
+
+
+def measure(reply, count):
+    """Returns the seconds it takes to receive and parse `count` replies."""
+    rx = RecvBuffer(FakeSocket(reply))
+    start = time.perf_counter()
+    for _ in range(count):
+        (s, e) = rx.read_until(b'\r\n')
+        _parse_reply(rx.buf, s, e)
+    return time.perf_counter() - start
+
+
+def bench(name, reply, count):
+    elapsed = measure(reply, count)
+    print('%-12s %10d bytes %10.2f us/reply %10.1f MB/s' %
+          (name, len(reply), elapsed / count * 1e6,
+           len(reply) * count / elapsed / 1e6))
+
+
+def main():
+    bench('small', b'00\r\n', 200000)
+    bench('io_output', b'some output\r00\r\n', 200000)
+    bench('1 KiB', b'x' * 1024 + b'0\r\n', 50000)
+    bench('1 MiB', b'x' * 2**20 + b'0\r\n', 100)
+    bench('8 MiB', b'x' * 2**23 + b'0\r\n', 10)
+
+
+if __name__ == '__main__':
+    main()
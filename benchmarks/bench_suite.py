@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+#
+# Benchmark suite of the protocol and the object model.
+#
+# Runs the hot paths against a local simulated TclServer (pyixia.simulator)
+# and reports the wall time and the number of round trips of every case. The
+# results can be written as JSON and compared with the results of an earlier
+# run, eg. of the last release:
+#
+#   bench_suite.py --json baseline.json
+#   bench_suite.py --compare baseline.json
+#
+# The comparison fails if a case needs more round trips or is slower by more
+# than the given tolerance.
+#
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyixia import Ixia, Statistics  # noqa: E402
+from pyixia.simulator import Simulator  # noqa: E402
+from pyixia.tclproto import TclSocketClient  # noqa: E402
+
+import bench_reply_parser  # noqa: E402
+
+ALL_COUNTERS = list(Statistics._ix_members)
+
+
+def measure(sim, fn, repeat, teardown=None):
+    """Runs `fn` `repeat` times and returns the median wall time and the
+    round trips of one run."""
+    times = list()
+    for _ in range(repeat):
+        sim.reset_counters()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+        round_trips = sim.requests
+        if teardown is not None:
+            teardown(result)
+    return dict(wall_time=statistics.median(times), round_trips=round_trips)
+
+
+def bench_connect(sim, url, ixia, args):
+    def connect():
+        i = Ixia(url)
+        i.connect()
+        return i
+    return measure(sim, connect, args.repeat, lambda i: i.disconnect())
+
+
+def bench_discover(sim, url, ixia, args):
+    return measure(sim, ixia.discover, args.repeat)
+
+
+def bench_stats(sim, url, ixia, args):
+    ports = list(ixia._port_index().values())[:args.stats_ports]
+    result = measure(sim, lambda: ixia.fetch_stats(ports, ALL_COUNTERS),
+                     args.repeat)
+    result['ports'] = len(ports)
+    result['counters'] = len(ALL_COUNTERS)
+    return result
+
+
+def bench_reconfigure(sim, url, ixia, args):
+    ports = ixia.chassis.cards[0].ports
+    runs = [0]
+
+    def reconfigure():
+        runs[0] += 1
+        for port in ports:
+            with port.configure(write=True) as p:
+                p.loopback = runs[0] % 2
+    result = measure(sim, reconfigure, args.repeat)
+    result['ports'] = len(ports)
+    return result
+
+
+def bench_port_group(sim, url, ixia, args):
+    pg = ixia.new_port_group()
+    pg.create()
+    for port in list(ixia._port_index().values())[:args.stats_ports]:
+        pg.add_port(port)
+
+    def start_stop():
+        pg.start_transmit()
+        pg.stop_transmit()
+    result = measure(sim, start_stop, args.repeat)
+    pg.destroy()
+    result['ports'] = len(pg.ports)
+    return result
+
+
+def bench_calls(sim, url, ixia, args):
+    (host, port) = url.split('//')[1].split(':')
+    tcl = TclSocketClient(host, int(port))
+    tcl.connect()
+    count = args.calls
+
+    def sequential():
+        for _ in range(count):
+            tcl.call('set x 1')
+
+    def pipelined():
+        tcl.call_many(['set x 1'] * count)
+
+    result = dict()
+    for (name, fn) in (('sequential', sequential), ('pipelined', pipelined)):
+        r = measure(sim, fn, args.repeat)
+        result['%s_calls_per_sec' % name] = count / r['wall_time']
+    tcl.close()
+    result['calls'] = count
+    return result
+
+
+def bench_parser(sim, url, ixia, args):
+    result = dict()
+    for (name, reply, count) in (('small', b'00\r\n', 100000),
+                                 ('1mib', b'x' * 2**20 + b'0\r\n', 50)):
+        elapsed = bench_reply_parser.measure(reply, count)
+        result['%s_replies_per_sec' % name] = count / elapsed
+        result['%s_mb_per_sec' % name] = len(reply) * count / elapsed / 1e6
+    return result
+
+
+BENCHMARKS = [
+    ('connect', bench_connect),
+    ('discover', bench_discover),
+    ('stats', bench_stats),
+    ('reconfigure', bench_reconfigure),
+    ('port_group', bench_port_group),
+    ('calls', bench_calls),
+    ('parser', bench_parser),
+]
+
+
+def run(args):
+    sim = Simulator(card_count=args.cards, port_count=args.ports,
+                    latency=args.latency, jitter=args.jitter, seed=1)
+    results = dict()
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        ixia.discover()
+        for (name, fn) in BENCHMARKS:
+            if args.only and name not in args.only:
+                continue
+            results[name] = fn(sim, server.url, ixia, args)
+        ixia.disconnect()
+    return dict(python=platform.python_version(),
+                platform=platform.platform(),
+                latency=args.latency, jitter=args.jitter, cards=args.cards,
+                ports=args.ports, results=results)
+
+
+def print_results(report):
+    for (name, result) in report['results'].items():
+        values = ' '.join('%s=%.4g' % (k, v) if isinstance(v, float)
+                          else '%s=%s' % (k, v)
+                          for (k, v) in sorted(result.items()))
+        print('%-12s %s' % (name, values))
+
+
+def compare(report, baseline, tolerance):
+    """Returns a list of regressions against a baseline report."""
+    regressions = list()
+    for (name, result) in report['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        for (key, value) in result.items():
+            if key not in old:
+                continue
+            if key == 'round_trips' and value > old[key]:
+                regressions.append('%s: %d round trips, was %d' %
+                                   (name, value, old[key]))
+            elif key == 'wall_time' and value > old[key] * tolerance:
+                regressions.append('%s: %.4g s, was %.4g s' %
+                                   (name, value, old[key]))
+            elif key.endswith('_per_sec') and value * tolerance < old[key]:
+                regressions.append('%s: %s %.4g, was %.4g' %
+                                   (name, key, value, old[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Benchmarks pyixia against a simulated TclServer.')
+    parser.add_argument('--cards', type=int, default=12,
+                        help='number of cards of the chassis')
+    parser.add_argument('--ports', type=int, default=17,
+                        help='number of ports per card')
+    parser.add_argument('--stats-ports', type=int, default=200,
+                        help='number of ports to read the statistics of')
+    parser.add_argument('--calls', type=int, default=2000,
+                        help='number of calls for the throughput benchmark')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='simulated jitter in seconds')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of runs of every benchmark')
+    parser.add_argument('--only', action='append',
+                        choices=[name for (name, fn) in BENCHMARKS],
+                        help='run only the given benchmark')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare with the JSON results of a former run')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='allowed slow down factor for --compare')
+    args = parser.parse_args()
+
+    report = run(args)
+    print_results(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,15 +3,34 @@
 # Copyright (c) 2015 Kontron Europe GmbH
 #
 
+import itertools
 import logging
-import urllib.parse
-from .tclproto import TclSocketClient, TclSSHClient
-from .ixapi import _MetaIxTclApi, TclMember, FLAG_RDONLY
-from .ixapi import IxTclHalApi, IxTclHalError
+from concurrent.futures import ThreadPoolExecutor
+from .helper import tcl_list_split, tcl_quote
+from .tclproto import TclSocketClient, TclSSHClient, AsyncTclSocketClient
+from .tclproto import TclError
+from .ixapi import _MetaIxTclApi, TclMember, FLAG_RDONLY, CACHE_STATIC
+from .ixapi import IxTclHalApi, IxTclHalError, AsyncIxTclHalApi
+from .ixapi import _cache_get
+from .capture import CaptureBuffer
+from .instrument import Instrumentation
+from .pool import TclConnectionPool
+from .replay import RecordingClient, ReplayClient
+from .sampler import StatsSampler
+from .topology import TopologyCache
+from .transports import get_transport, parse_url, register_transport
 
 log = logging.getLogger(__name__)
 
 
+def __getattr__(name):
+    # StatsFrame needs numpy, which takes a while to load
+    if name == 'StatsFrame':
+        from .statsframe import StatsFrame
+        return StatsFrame
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
 class PortGroup(metaclass=_MetaIxTclApi):
     START_TRANSMIT = 7
     STOP_TRANSMIT = 8
@@ -31,22 +50,28 @@ class PortGroup(metaclass=_MetaIxTclApi):
             TclMember('lastTimeStamp', type=int, flags=FLAG_RDONLY),
     ]
 
-    next_free_id = 1
+    # shared by all threads, next() of a count is atomic
+    _ids = itertools.count(1)
 
     def __init__(self, api, id=None):
-        self._api = api
+        # a port group exists on one connection of the TclServer only
+        self._api = api.pinned()
         self.ports = list()
         if id is None:
-            self.id = self.next_free_id
-            self.next_free_id += 1
+            self.id = next(PortGroup._ids)
         else:
             self.id = id
 
-    def _ix_get(self):
+    def _ix_get_cmd(self, member):
+        return None
+
+    def _ix_get(self, member):
         pass
 
     def create(self):
-        self._api.call_rc('portGroup create %s', self.id)
+        """Creates the group. Within a batch, the
+        :class:`pyixia.ixapi.BatchResult` of the command is returned."""
+        return self._api.call_rc('portGroup create %s', self.id)
 
     def destroy(self):
         self._api.call_rc('portGroup destroy %s', self.id)
@@ -61,6 +86,22 @@ class PortGroup(metaclass=_MetaIxTclApi):
         self._api.call_rc('portGroup del %s %d %d %d',
                           self.id, *port._port_id())
 
+    def add_ports(self, ports):
+        """Adds several ports in one round trip."""
+        with self._api.batch():
+            for port in ports:
+                self.add_port(port)
+
+    def set_ports(self, ports):
+        """Changes the members of the group to exactly the given ports. The
+        ports which are no longer members are removed and the new ones are
+        added in one round trip."""
+        ports = list(ports)
+        with self._api.batch():
+            for port in [p for p in self.ports if p not in ports]:
+                self.del_port(port)
+            self.add_ports([p for p in ports if p not in self.ports])
+
     def _set_command(self, cmd):
         self._api.call_rc('portGroup setCommand %s %d', self.id, cmd)
 
@@ -101,6 +142,69 @@ class PortGroup(metaclass=_MetaIxTclApi):
             self._set_command(self.CLEAR_OWNERSHIP_FORCED)
 
 
+class PortGroupManager:
+    """Keeps the port groups of a connection, so the same set of ports
+    always uses the same group.
+
+    A group is created with all its ports in one round trip the first time
+    it is requested. Thus, eg. repeated start/stop cycles on the same ports
+    don't create, fill and destroy a group every time. With a pool, all
+    groups live on its dedicated connection.
+    """
+    def __init__(self, api):
+        self._api = api.pinned()
+        self._groups = dict()
+
+    @staticmethod
+    def _key(ports):
+        return frozenset(port._port_id() for port in ports)
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __iter__(self):
+        return iter(list(self._groups.values()))
+
+    def get(self, ports):
+        """Returns the group of exactly the given ports, a new one is
+        created if there is none yet."""
+        ports = list(ports)
+        key = self._key(ports)
+        pg = self._groups.get(key)
+        if pg is None:
+            pg = PortGroup(self._api)
+            try:
+                with self._api.batch():
+                    created = pg.create()
+                    pg.add_ports(ports)
+            except (IxTclHalError, TclError):
+                # The group may have been created before a port failed. If
+                # the create failed, the ID may belong to someone else.
+                if created.succeeded():
+                    try:
+                        pg.destroy()
+                    except (IxTclHalError, TclError):
+                        pass
+                raise
+            self._groups[key] = pg
+        return pg
+
+    def release(self, pg):
+        """Destroys a group of this manager."""
+        for (key, group) in list(self._groups.items()):
+            if group is pg:
+                del self._groups[key]
+        pg.destroy()
+
+    def clear(self):
+        """Destroys all groups in one round trip."""
+        groups = list(self._groups.values())
+        self._groups.clear()
+        with self._api.batch():
+            for pg in groups:
+                pg.destroy()
+
+
 class Statistics(metaclass=_MetaIxTclApi):
     """Per port statistics."""
     __tcl_command__ = 'stat'
@@ -120,21 +224,154 @@ class Statistics(metaclass=_MetaIxTclApi):
         self._api = api
         self.port = port
 
+    @classmethod
+    def counter_members(cls, counters):
+        """Returns the :class:`TclMember` of each counter, given by its
+        attribute name, eg. 'frames_sent'."""
+        try:
+            return [cls._ix_members[c] for c in counters]
+        except KeyError as e:
+            raise ValueError('Unknown counter %s' % e)
+
+    def _ix_get_cmd(self, member):
+        return 'stat get %s %d %d %d' % ((member.name,) +
+                                         self.port._port_id())
+
     def _ix_get(self, member):
-        self._api.call('stat get %s %d %d %d',
-                       member.name, *self.port._port_id())
+        self._api.call(self._ix_get_cmd(member))
 
     def _ix_set(self, member):
         self._api.call('stat set %s %d %d %d',
                        member.name, *self.port._port_id())
 
 
+class Capture(metaclass=_MetaIxTclApi):
+    """Per port capture settings. The captured frames are read by a
+    :class:`pyixia.capture.CaptureBuffer`."""
+    __tcl_command__ = 'capture'
+    __tcl_members__ = [
+            TclMember('nPackets', type=int, flags=FLAG_RDONLY),
+            TclMember('captureMode', type=int),
+            TclMember('fullAction', type=int),
+            TclMember('sliceSize', type=int),
+            TclMember('sliceOffset', type=int),
+    ]
+
+    MODE_CONTINUOUS = 0
+    MODE_TRIGGER = 1
+
+    FULL_ACTION_LOCK = 0
+    FULL_ACTION_WRAP = 1
+
+    def __init__(self, api, port):
+        self._api = api
+        self.port = port
+
+    def _ix_get_cmd(self, member):
+        return 'capture get %d %d %d' % self.port._port_id()
+
+    def _ix_get(self, member):
+        self._api.call_rc(self._ix_get_cmd(member))
+
+    def _ix_set_cmd(self):
+        return 'capture set %d %d %d' % self.port._port_id()
+
+    def _ix_set(self, member):
+        self._api.call_rc(self._ix_set_cmd())
+
+
+class Stream(metaclass=_MetaIxTclApi):
+    """A stream of a port. Use :meth:`Port.write_streams` to program many
+    streams at once."""
+    __tcl_command__ = 'stream'
+    __tcl_members__ = [
+            TclMember('name'),
+            TclMember('enable'),
+            TclMember('dma', type=int),
+            TclMember('numFrames', type=int),
+            TclMember('numBursts', type=int),
+            TclMember('loopCount', type=int),
+            TclMember('returnToId', type=int),
+            TclMember('rateMode', type=int),
+            TclMember('percentPacketRate', type=float),
+            TclMember('fpsRate', type=float),
+            TclMember('ifg', type=float),
+            TclMember('framesize', type=int),
+            TclMember('frameSizeType', type=int),
+            TclMember('frameSizeMIN', type=int),
+            TclMember('frameSizeMAX', type=int),
+            TclMember('da'),
+            TclMember('sa'),
+            TclMember('numDA', type=int),
+            TclMember('numSA', type=int),
+            TclMember('daRepeatCounter', type=int),
+            TclMember('saRepeatCounter', type=int),
+            TclMember('patternType', type=int),
+            TclMember('dataPattern', type=int),
+            TclMember('pattern'),
+    ]
+
+    DMA_CONTINUOUS_PACKET = 0
+    DMA_CONTINUOUS_BURST = 1
+    DMA_STOP_STREAM = 2
+    DMA_ADVANCE = 3
+    DMA_GOTO_FIRST = 4
+    DMA_FIRST_LOOP_COUNT = 5
+
+    RATE_MODE_GAP = 0
+    RATE_MODE_PERCENT = 1
+    RATE_MODE_FPS = 2
+    RATE_MODE_BPS = 3
+
+    # Configures the streams first.. of a port from a list of option lists,
+    # eg. {{-name a -framesize 64} {-name b}}, and writes the port. Returns
+    # the rc of the first failing command.
+    WRITE_SCRIPT = (
+        'proc __pyixia_streams {ch c p id streams} {'
+        ' foreach options $streams {'
+        '  stream setDefault;'
+        '  foreach {o v} $options {stream config $o $v};'
+        '  if {[set rc [stream set $ch $c $p $id]] != 0} {return $rc};'
+        '  incr id'
+        ' };'
+        ' return [port write $ch $c $p]'
+        '}; '
+        '__pyixia_streams %d %d %d %d %s'
+    )
+
+    def __init__(self, api, port, id):
+        self._api = api
+        self.port = port
+        self.id = id
+
+    def _stream_id(self):
+        return self.port._port_id() + (self.id,)
+
+    def _ix_get_cmd(self, member):
+        return 'stream get %d %d %d %d' % self._stream_id()
+
+    def _ix_get(self, member):
+        self._api.call_rc(self._ix_get_cmd(member))
+
+    def _ix_set_cmd(self):
+        return 'stream set %d %d %d %d' % self._stream_id()
+
+    def _ix_set(self, member):
+        self._api.call_rc(self._ix_set_cmd())
+
+    def _ix_write_cmd(self):
+        return 'stream write %d %d %d %d' % self._stream_id()
+
+    def __str__(self):
+        return '%d/%d/%d/%d' % self._stream_id()
+
+
 class Port(metaclass=_MetaIxTclApi):
     __tcl_command__ = 'port'
     __tcl_members__ = [
             TclMember('name'),
             TclMember('owner', flags=FLAG_RDONLY),
-            TclMember('type', type=int, flags=FLAG_RDONLY),
+            TclMember('type', type=int, flags=FLAG_RDONLY, cache=CACHE_STATIC),
             TclMember('loopback'),
             TclMember('flowControl'),
             TclMember('linkState', type=int, flags=FLAG_RDONLY),
@@ -163,12 +400,22 @@ class Port(metaclass=_MetaIxTclApi):
         self.id = id
         self._api = tcl
         self.stats = Statistics(tcl, self)
+        self.capture = Capture(tcl, self)
+
+    def _ix_get_cmd(self, member):
+        return 'port get %d %d %d' % self._port_id()
 
     def _ix_get(self, member):
-        self._api.call_rc('port get %d %d %d', *self._port_id())
+        self._api.call_rc(self._ix_get_cmd(member))
+
+    def _ix_set_cmd(self):
+        return 'port set %d %d %d' % self._port_id()
 
     def _ix_set(self, member):
-        self._api.call_rc('port set %d %d %d', *self._port_id())
+        self._api.call_rc(self._ix_set_cmd())
+
+    def _ix_write_cmd(self):
+        return 'port write %d %d %d' % self._port_id()
 
     def _port_id(self):
         return self.card._card_id() + (self.id,)
@@ -177,7 +424,32 @@ class Port(metaclass=_MetaIxTclApi):
         return '%d/%d/%d' % self._port_id()
 
     def commit(self):
-        self._api.call('port write %d %d %d', *self._port_id())
+        self._api.call(self._ix_write_cmd())
+
+    def stream(self, id):
+        return Stream(self._api, self, id)
+
+    def write_streams(self, streams, first_id=1):
+        """Programs a list of streams, starting with the stream ID
+        `first_id`, and writes them to the hardware in a single round trip.
+
+        Every stream is given as a dict, which maps attribute names of
+        :class:`Stream` to their values. Members which are not given keep
+        their default values. Returns the list of :class:`Stream` objects.
+        """
+        options = list()
+        for stream in streams:
+            words = list()
+            for (attrname, value) in stream.items():
+                try:
+                    m = Stream._ix_members[attrname]
+                except KeyError:
+                    raise ValueError('Unknown stream member %s' % attrname)
+                words.extend(('-' + m.name, tcl_quote(m.type(value))))
+            options.append('{%s}' % ' '.join(words))
+        self._api.call_rc(Stream.WRITE_SCRIPT, *(self._port_id() + (
+            first_id, '{%s}' % ' '.join(options))))
+        return [self.stream(first_id + n) for n in range(len(options))]
 
     def factory_defaults(self):
         self._api.call('port setFactoryDefaults %d %d %d', *self._port_id())
@@ -195,13 +467,17 @@ class Card(metaclass=_MetaIxTclApi):
             TclMember('clockRxRisingEdge', type=int),
             TclMember('clockSelect', type=int),
             TclMember('clockTxRisingEdge', type=int),
-            TclMember('fpgaVersion', type=int, flags=FLAG_RDONLY),
-            TclMember('hwVersion', type=int, flags=FLAG_RDONLY),
-            TclMember('portCount', type=int, flags=FLAG_RDONLY),
-            TclMember('serialNumber', type=int, flags=FLAG_RDONLY),
+            TclMember('fpgaVersion', type=int, flags=FLAG_RDONLY,
+                      cache=CACHE_STATIC),
+            TclMember('hwVersion', type=int, flags=FLAG_RDONLY,
+                      cache=CACHE_STATIC),
+            TclMember('portCount', type=int, flags=FLAG_RDONLY,
+                      cache=CACHE_STATIC),
+            TclMember('serialNumber', type=int, flags=FLAG_RDONLY,
+                      cache=CACHE_STATIC),
             TclMember('txFrequencyDeviation', type=int),
-            TclMember('type', type=int, flags=FLAG_RDONLY),
-            TclMember('typeName'),
+            TclMember('type', type=int, flags=FLAG_RDONLY, cache=CACHE_STATIC),
+            TclMember('typeName', cache=CACHE_STATIC),
     ]
 
     TYPE_NONE = 0
@@ -212,13 +488,21 @@ class Card(metaclass=_MetaIxTclApi):
         self.ports = []
         self._api = api
 
+    def _ix_get_cmd(self, member):
+        return 'card get %d %d' % self._card_id()
+
     def _ix_get(self, member):
-        self._api.call_rc('card get %d %d', *self._card_id())
+        self._api.call_rc(self._ix_get_cmd(member))
+
+    def _ix_set_cmd(self):
+        return 'card set %d %d' % self._card_id()
 
     def _ix_set(self, member):
-        self._api.call_rc('card set %d %d', *self._card_id())
+        self._api.call_rc(self._ix_set_cmd())
 
     def discover(self):
+        self.ports = []
+        self.chassis.generation += 1
         for pid in range(self.port_count):
             pid += 1  # one-based
             port = Port(self._api, self, pid)
@@ -226,7 +510,7 @@ class Card(metaclass=_MetaIxTclApi):
             self.ports.append(port)
 
     def _card_id(self):
-        return (self.chassis.id, self.id)
+        return (self.chassis._chassis_id(), self.id)
 
     def __str__(self):
         return '%d/%d' % self._card_id()
@@ -238,16 +522,19 @@ class Chassis(metaclass=_MetaIxTclApi):
             TclMember('baseIpAddress'),
             TclMember('cableLength', type=int),
             TclMember('hostname', flags=FLAG_RDONLY),
-            TclMember('id', type=int),
+            TclMember('id', type=int, cache=CACHE_STATIC),
             TclMember('ipAddress', flags=FLAG_RDONLY),
-            TclMember('ixServerVersion', flags=FLAG_RDONLY),
+            TclMember('ixServerVersion', flags=FLAG_RDONLY,
+                      cache=CACHE_STATIC),
             TclMember('master', flags=FLAG_RDONLY),
-            TclMember('maxCardCount', type=int, flags=FLAG_RDONLY),
+            TclMember('maxCardCount', type=int, flags=FLAG_RDONLY,
+                      cache=CACHE_STATIC),
             TclMember('name'),
-            TclMember('operatingSystem', type=int, flags=FLAG_RDONLY),
+            TclMember('operatingSystem', type=int, flags=FLAG_RDONLY,
+                      cache=CACHE_STATIC),
             TclMember('sequence', type=int),
-            TclMember('type', type=int, flags=FLAG_RDONLY),
-            TclMember('typeName', flags=FLAG_RDONLY),
+            TclMember('type', type=int, flags=FLAG_RDONLY, cache=CACHE_STATIC),
+            TclMember('typeName', flags=FLAG_RDONLY, cache=CACHE_STATIC),
     ]
 
     TYPE_1600 = 2
@@ -276,6 +563,8 @@ class Chassis(metaclass=_MetaIxTclApi):
         self.host = host
         self.cards = []
         self._api = api
+        # incremented whenever the cards or ports change
+        self.generation = 0
 
     def _ix_add(self):
         self._api.call_rc('chassis add %s', self.host)
@@ -283,11 +572,22 @@ class Chassis(metaclass=_MetaIxTclApi):
     def _ix_del(self):
         self._api.call_rc('chassis del %s', self.host)
 
+    def _ix_get_cmd(self, member):
+        return 'chassis get %s' % self.host
+
     def _ix_get(self, member):
-        self._api.call_rc('chassis get %s', self.host)
+        self._api.call_rc(self._ix_get_cmd(member))
+
+    def _ix_set_cmd(self):
+        return 'chassis set %s' % self.host
 
     def _ix_set(self, member):
-        self._api.call_rc('chassis set %s', self.host)
+        self._api.call_rc(self._ix_set_cmd())
+
+    def _chassis_id(self):
+        # The ID is cached, thus this doesn't ask the TclServer each time a
+        # card or port ID is needed.
+        return self.id
 
     def connect(self, chassis_id=1):
         self._ix_add()
@@ -296,7 +596,51 @@ class Chassis(metaclass=_MetaIxTclApi):
     def disconnect(self):
         self._ix_del()
 
-    def discover(self):
+    # Walks all card slots and ports on the TclServer and returns a list
+    #   {typeName maxCardCount {{card type typeName portCount
+    #       {{port type} ..}} ..}}
+    # The type of ports which cannot be read is empty.
+    DISCOVER_SCRIPT = (
+        'proc __pyixia_discover {host ch} {'
+        ' if {[chassis get $host] != 0} {return -code error 1};'
+        ' set max [chassis cget -maxCardCount];'
+        ' set cards {};'
+        ' for {set c 1} {$c <= $max} {incr c} {'
+        '  if {[catch {card get $ch $c} rc] || $rc != 0} continue;'
+        '  set card [list $c [card cget -type] [card cget -typeName]'
+        '   [set n [card cget -portCount]]];'
+        '  set ports {};'
+        '  for {set p 1} {$p <= $n} {incr p} {'
+        '   if {[catch {port get $ch $c $p} rc] || $rc != 0} {'
+        '    lappend ports [list $p {}]; continue'
+        '   };'
+        '   lappend ports [list $p [port cget -type]]'
+        '  };'
+        '  lappend card $ports;'
+        '  lappend cards $card'
+        ' };'
+        ' return [list [chassis cget -typeName] $max $cards]'
+        '}; '
+        '__pyixia_discover %s %d'
+    )
+
+    def discover(self, server_side=True):
+        """Discovers all cards and their ports.
+
+        By default, the chassis is walked by a TCL procedure on the TclServer
+        in a single round trip. If that fails, or `server_side` is False, the
+        card slots are probed one by one.
+        """
+        self.cards = []
+        self.generation += 1
+        if server_side:
+            try:
+                self._discover_server_side()
+                return
+            except TclError as e:
+                log.info('Server side discovery failed (%s), probing slots', e)
+                self.cards = []
+
         log.info('Discover chassis %d (%s)', self.id, self.type_name)
         for cid in range(self.max_card_count):
             # unfortunately there is no config option which cards are used. So
@@ -311,6 +655,64 @@ class Chassis(metaclass=_MetaIxTclApi):
             except IxTclHalError:
                 pass
 
+    def _discover_server_side(self):
+        script = self.DISCOVER_SCRIPT % (tcl_quote(self.host),
+                                         self._chassis_id())
+        (type_name, max_card_count, cards) = tcl_list_split(
+                self._api.call('%s', script)[0])
+        topology = dict(type_name=type_name,
+                        max_card_count=int(max_card_count), cards=list())
+        for card_info in tcl_list_split(cards):
+            (cid, type, type_name, port_count, ports) = \
+                tcl_list_split(card_info)
+            card = dict(id=int(cid), type=int(type), type_name=type_name,
+                        port_count=int(port_count), ports=list())
+            for port_info in tcl_list_split(ports):
+                (pid, type) = tcl_list_split(port_info)
+                card['ports'].append(dict(id=int(pid),
+                                          type=int(type) if type else None))
+            topology['cards'].append(card)
+        self.build(topology)
+
+    def topology(self):
+        """Returns a description of the discovered cards and ports, made of
+        dicts and lists, which can be used to :meth:`build` the same tree
+        again. Only static values are included."""
+        cards = list()
+        for card in self.cards:
+            ports = list()
+            for port in card.ports:
+                (hit, type) = _cache_get(port, Port._ix_members['type'])
+                ports.append(dict(id=port.id, type=type if hit else None))
+            cards.append(dict(id=card.id, type=card.type,
+                              type_name=card.type_name,
+                              port_count=card.port_count, ports=ports))
+        return dict(type_name=self.type_name,
+                    max_card_count=self.max_card_count, cards=cards)
+
+    def build(self, topology):
+        """Builds the tree of cards and ports from a description returned by
+        :meth:`topology`, without asking the TclServer."""
+        self.cards = []
+        self.generation += 1
+        self._ix_cache_update(type_name=topology['type_name'],
+                              max_card_count=topology['max_card_count'])
+        log.info('Discover chassis %d (%s)', self._chassis_id(),
+                 topology['type_name'])
+        for card_info in topology['cards']:
+            card = Card(self._api, self, card_info['id'])
+            card._ix_cache_update(type=card_info['type'],
+                                  type_name=card_info['type_name'],
+                                  port_count=card_info['port_count'])
+            log.info('Adding card %s (%s)', card, card_info['type_name'])
+            for port_info in card_info['ports']:
+                port = Port(self._api, card, port_info['id'])
+                if port_info['type'] is not None:
+                    port._ix_cache_update(type=port_info['type'])
+                log.info('Adding port %s', port)
+                card.ports.append(port)
+            self.cards.append(card)
+
 
 class Session(metaclass=_MetaIxTclApi):
     __tcl_command__ = 'session'
@@ -321,56 +723,372 @@ class Session(metaclass=_MetaIxTclApi):
 
     def __init__(self, api):
         self._api = api
+        self.username = None
+
+    def _ix_get_cmd(self, member):
+        return 'session get'
 
     def _ix_get(self, member):
-        self._api.call_rc('session get')
+        self._api.call_rc(self._ix_get_cmd(member))
+
+    def _ix_set_cmd(self):
+        return 'session set'
 
     def _ix_set(self, member):
-        self._api.call_rc('session set')
+        self._api.call_rc(self._ix_set_cmd())
 
     def login(self, username):
+        """Logs in. With a pool, every connection is logged in."""
         self._api.call_rc('session login %s', username)
+        self.username = username
+        self._api.reset_connections()
 
     def logout(self):
         self._api.call_rc('session logout')
+        self.username = None
+        self._api.reset_connections()
+
+
+def expand_port_ids(pids):
+    """Expands a list of port IDs to (chassis, card, port) tuples.
+
+    An ID is either a tuple or a string 'chassis/card/port', where each part
+    may be a range, eg. '1/2/1-16'.
+    """
+    for pid in pids:
+        if type(pid) != str:
+            yield tuple(pid)
+            continue
+        parts = pid.split('/')
+        if len(parts) != 3:
+            raise ValueError('Invalid port ID "%s"' % pid)
+        ranges = list()
+        for part in parts:
+            (first, _, last) = part.partition('-')
+            try:
+                (first, last) = (int(first), int(last or first))
+            except ValueError:
+                raise ValueError('Invalid port ID "%s"' % pid)
+            if last < first:
+                raise ValueError('Invalid port ID "%s"' % pid)
+            ranges.append(range(first, last + 1))
+        yield from itertools.product(*ranges)
+
+
+def _single_port_id(pid):
+    """Returns the (chassis, card, port) tuple of an ID without ranges."""
+    pids = list(expand_port_ids([pid]))
+    if len(pids) != 1:
+        raise ValueError('Invalid port ID "%s"' % pid)
+    return pids[0]
 
 
 class Ixia:
-    """This class supports only one chassis atm."""
-    def __init__(self, url):
-        o = urllib.parse.urlparse(url, scheme='socket')
-        self.host = o.netloc or o.path
-        if o.scheme == 'socket':
-            self._tcl = TclSocketClient(self.host)
-        elif o.scheme == 'ssh':
-            self._tcl = TclSSHClient(self.host)
+    """This class supports only one chassis atm.
+
+    If `pool_size` is given, up to `pool_size` connections to the TclServer
+    are used, so independent work of several threads can run in parallel.
+
+    If a :class:`pyixia.topology.TopologyCache` is given, the discovered cards
+    and ports are stored on disk and reused as long as the IxServer and TCL
+    HAL versions don't change.
+
+    With `record`, all requests and replies are written to the given trace
+    file, see :class:`pyixia.replay.RecordingClient`. With `replay`, no
+    connection is made at all and the replies are read from such a trace.
+    If `replay_timing` is True, every reply takes as long as it took when
+    it was recorded.
+    """
+    def __init__(self, url, pool_size=None, topology_cache=None, record=None,
+                 replay=None, replay_timing=False):
+        (scheme, self.host, kwargs) = parse_url(url)
+        client_cls = get_transport(scheme)
+        if (record or replay) and pool_size is not None:
+            raise ValueError('Traces are not supported with a pool')
+        if replay is not None:
+            self._tcl = ReplayClient(replay, timing=replay_timing)
+        elif pool_size is None:
+            self._tcl = client_cls(self.host, **kwargs)
         else:
-            raise RuntimeError('Unknown URL scheme "%s"' % o.scheme)
+            # SSH connections share one handshake, see TclSSHClient.channel()
+            factory = getattr(client_cls(self.host, **kwargs), 'channel',
+                              lambda: client_cls(self.host, **kwargs))
+            self._tcl = TclConnectionPool(factory, pool_size,
+                                          self._setup_connection)
+        if record is not None:
+            self._tcl = RecordingClient(self._tcl, record)
+        # eg. a replayed trace knows the host of the recorded session
+        self.host = getattr(self._tcl, 'host', self.host)
         self._api = IxTclHalApi(self._tcl)
         self.chassis = Chassis(self._api, self.host)
         self.session = Session(self._api)
+        self.port_groups = PortGroupManager(self._api)
+        self._index = dict()
+        self._index_generation = None
+        self.topology_cache = topology_cache
+
+    def _setup_connection(self, tcl):
+        # every pooled connection needs to know about the chassis and the
+        # user. The dedicated connection of the pool is set up again after
+        # a login or logout.
+        api = IxTclHalApi(tcl)
+        with api.batch():
+            Chassis(api, self.host).connect(self._chassis_id)
+            if self.session.username is not None:
+                api.call_rc('session login %s', self.session.username)
+            else:
+                api.call('session logout')
 
-    def connect(self):
+    def connect(self, chassis_id=1):
+        self._chassis_id = chassis_id
         self._tcl.connect()
-        self.chassis.connect()
+        if isinstance(self._tcl, TclConnectionPool):
+            self.chassis._ix_cache_update(id=chassis_id)
+        else:
+            self.chassis.connect(chassis_id)
 
     def disconnect(self):
-        self.chassis.disconnect()
-        self._tcl.close()
+        try:
+            self.port_groups.clear()
+        finally:
+            try:
+                self.chassis.disconnect()
+            finally:
+                self._tcl.close()
+
+    def _port_index(self):
+        if self._index_generation != self.chassis.generation:
+            index = dict()
+            for card in self.chassis.cards:
+                for port in card.ports:
+                    index[port._port_id()] = port
+            self._index = index
+            self._index_generation = self.chassis.generation
+        return self._index
 
     def get_port(self, pid):
-        if type(pid) == str:
-            pid = tuple(map(int, pid.split('/')))
-        else:
-            pid = tuple(pid)
-        for card in self.chassis.cards:
-            for port in card.ports:
-                if pid == port._port_id():
-                    return port
-        raise LookupError()
+        """Returns the port with the ID 'chassis/card/port' or
+        (chassis, card, port)."""
+        pid = _single_port_id(pid)
+        try:
+            return self._port_index()[pid]
+        except KeyError:
+            raise LookupError('No port %s' % '/'.join(map(str, pid)))
+
+    def get_ports(self, pids):
+        """Returns the ports of a list of IDs. Each part of an ID may also
+        be a range, eg. '1/2/1-16'."""
+        index = self._port_index()
+        ports = list()
+        for pid in expand_port_ids(pids):
+            try:
+                ports.append(index[pid])
+            except KeyError:
+                raise LookupError('No port %s' % '/'.join(map(str, pid)))
+        return ports
+
+    def find_ports(self, name=None, owner=None):
+        """Returns all ports with the given name and/or owner. The names and
+        owners of all ports are read in one round trip."""
+        ports = list(self._port_index().values())
+        members = [Port._ix_members['name'], Port._ix_members['owner']]
+        values = self._api.fetch([(port, members) for port in ports])
+        return [port for (port, (n, o)) in zip(ports, values)
+                if (name is None or n == name) and
+                (owner is None or o == owner)]
+
+    def instrument(self):
+        """See :meth:`pyixia.ixapi.IxTclHalApi.instrument`."""
+        return self._api.instrument()
 
     def new_port_group(self, id=None):
         return PortGroup(self._api, id)
 
+    def new_stats_sampler(self, ports, counters, interval=1.0, **kwargs):
+        return StatsSampler(self._api, ports, counters, interval, **kwargs)
+
+    def new_capture_buffer(self, port, segment_size=None):
+        """Returns a :class:`pyixia.capture.CaptureBuffer` for the port. By
+        default, the segment size of the session is used."""
+        if segment_size is None:
+            segment_size = self.session.capture_buffer_segment_size
+        return CaptureBuffer(self._api, port, segment_size)
+
+    def stats_frame(self, ports, counters):
+        from .statsframe import StatsFrame
+        return StatsFrame.fetch(self._api, ports, counters)
+
+    def fetch_stats(self, ports, counters):
+        """Reads the counters of the ports in one round trip.
+
+        Returns a dict which maps every port to a dict of counter values.
+        """
+        members = Statistics.counter_members(counters)
+        values = self._api.fetch([(port.stats, members) for port in ports])
+        return dict((port, dict(zip(counters, v)))
+                    for (port, v) in zip(ports, values))
+
+    def _topology_key(self):
+        with self._api.batch():
+            self._api.call_rc(self.chassis._ix_get_cmd(None))
+            version = self._api.call('chassis cget -ixServerVersion')
+            hal_version = self._api.call('version cget -ixTclHALVersion')
+        return dict(host=self.host, ix_server_version=version[0],
+                    hal_version=hal_version[0])
+
+    def discover(self, rediscover=False):
+        """Discovers the cards and ports of the chassis. With a topology
+        cache, the cached tree is used unless `rediscover` is True."""
+        if self.topology_cache is None:
+            return self.chassis.discover()
+
+        key = self._topology_key()
+        topology = None
+        if not rediscover:
+            topology = self.topology_cache.load(self.host, key)
+        if topology is not None:
+            log.info('Using cached topology of %s', self.host)
+            self.chassis.build(topology)
+        else:
+            self.chassis.discover()
+            self.topology_cache.save(self.host, key, self.chassis.topology())
+
+
+class MultiPortGroup:
+    """A port group spanning several chassis of a :class:`MultiIxia`.
+
+    There is one :class:`PortGroup` per chassis and every command is issued
+    on all of them concurrently.
+    """
+    def __init__(self, multi, ports, id=None):
+        self._multi = multi
+        self.ports = list(ports)
+        self.groups = dict()
+        for (ixia, ixia_ports) in multi._group_by_chassis(self.ports).items():
+            pg = ixia.new_port_group(id)
+            self.groups[pg] = ixia_ports
+
+    def _fan_out(self, fn, *args):
+        self._multi._map(lambda pg: fn(pg, *args), list(self.groups))
+
+    def create(self):
+        """Creates the port groups and adds all ports."""
+        def create(pg):
+            with pg._api.batch():
+                pg.create()
+                pg.add_ports(self.groups[pg])
+        self._fan_out(create)
+
+    def destroy(self):
+        self._fan_out(PortGroup.destroy)
+
+    def start_transmit(self):
+        self._fan_out(PortGroup.start_transmit)
+
+    def stop_transmit(self):
+        self._fan_out(PortGroup.stop_transmit)
+
+    def start_capture(self):
+        self._fan_out(PortGroup.start_capture)
+
+    def stop_capture(self):
+        self._fan_out(PortGroup.stop_capture)
+
+    def reset_statistics(self):
+        self._fan_out(PortGroup.reset_statistics)
+
+    def pause_transmit(self):
+        self._fan_out(PortGroup.pause_transmit)
+
+    def step_transmit(self):
+        self._fan_out(PortGroup.step_transmit)
+
+    def transmit_ping(self):
+        self._fan_out(PortGroup.transmit_ping)
+
+    def take_ownership(self, force=False):
+        self._fan_out(PortGroup.take_ownership, force)
+
+    def clear_ownership(self, force=False):
+        self._fan_out(PortGroup.clear_ownership, force)
+
+
+class MultiIxia:
+    """Controls several chassis, each with its own TclServer connection.
+
+    The chassis get consecutive IDs in the order of the URLs, starting with 1,
+    and ports are addressed globally as 'chassis/card/port'. Operations on
+    several chassis run concurrently, one thread per chassis, so they take as
+    long as the slowest chassis.
+    """
+    def __init__(self, urls):
+        self.ixias = [Ixia(url) for url in urls]
+        self._executor = None
+
+    def _map(self, fn, items):
+        if self._executor is None:
+            return list(map(fn, items))
+        return list(self._executor.map(fn, items))
+
+    def _get_ixia(self, chassis_id):
+        if not 1 <= chassis_id <= len(self.ixias):
+            raise LookupError('No chassis with ID %d' % chassis_id)
+        return self.ixias[chassis_id - 1]
+
+    def _group_by_chassis(self, ports):
+        ixias = dict((ixia.chassis, ixia) for ixia in self.ixias)
+        groups = dict()
+        for port in ports:
+            groups.setdefault(ixias[port.card.chassis], list()).append(port)
+        return groups
+
+    @property
+    def chassis(self):
+        return [ixia.chassis for ixia in self.ixias]
+
+    def connect(self):
+        self._executor = ThreadPoolExecutor(max_workers=len(self.ixias),
+                                            thread_name_prefix='pyixia')
+        self._map(lambda n: self.ixias[n].connect(n + 1),
+                  range(len(self.ixias)))
+
+    def disconnect(self):
+        if self._executor is None:
+            return
+        try:
+            self._map(Ixia.disconnect, self.ixias)
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+
     def discover(self):
-        return self.chassis.discover()
+        self._map(Ixia.discover, self.ixias)
+
+    def login(self, username):
+        self._map(lambda ixia: ixia.session.login(username), self.ixias)
+
+    def get_port(self, pid):
+        pid = _single_port_id(pid)
+        return self._get_ixia(pid[0]).get_port(pid)
+
+    def get_ports(self, pids):
+        return [self._get_ixia(pid[0]).get_port(pid)
+                for pid in expand_port_ids(pids)]
+
+    def new_port_group(self, ports, id=None):
+        return MultiPortGroup(self, ports, id)
+
+    def fetch_stats(self, ports, counters):
+        """Reads the counters of the ports, one round trip per chassis.
+
+        Returns a dict which maps every port to a dict of counter values.
+        """
+        def fetch(item):
+            (ixia, ixia_ports) = item
+            return ixia.fetch_stats(ixia_ports, counters)
+
+        stats = dict()
+        items = list(self._group_by_chassis(ports).items())
+        for values in self._map(fetch, items):
+            stats.update(values)
+        return stats
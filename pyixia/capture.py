@@ -0,0 +1,151 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import collections
+import logging
+import struct
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_SIZE = 1024
+
+LINKTYPE_ETHERNET = 1
+
+Frame = collections.namedtuple('Frame', 'timestamp length status data')
+Frame.__doc__ = """One captured frame.
+
+`timestamp` is the capture time in nanoseconds, `length` the length of the
+frame on the wire and `data` the captured bytes, which may be less than
+`length` if the capture was sliced.
+"""
+
+
+class PcapWriter:
+    """Writes frames to a pcap file with nanosecond timestamps."""
+    MAGIC = 0xa1b23c4d
+
+    def __init__(self, f, linktype=LINKTYPE_ETHERNET, snaplen=65535):
+        self.f = f
+        self.f.write(struct.pack('<IHHiIII', self.MAGIC, 2, 4, 0, 0,
+                                 snaplen, linktype))
+
+    def write(self, frame):
+        (sec, nsec) = divmod(frame.timestamp, 1000000000)
+        self.f.write(struct.pack('<IIII', sec, nsec, len(frame.data),
+                                 max(frame.length, len(frame.data))))
+        self.f.write(frame.data)
+
+
+class PcapngWriter:
+    """Writes frames to a pcapng file with one interface, whose timestamps
+    have a resolution of nanoseconds."""
+    def __init__(self, f, linktype=LINKTYPE_ETHERNET, snaplen=65535):
+        self.f = f
+        # section header block
+        self._block(0x0a0d0d0a, struct.pack('<IHHq', 0x1a2b3c4d, 1, 0, -1))
+        # interface description block with if_tsresol = 9
+        options = struct.pack('<HHB3xHH', 9, 1, 9, 0, 0)
+        self._block(1, struct.pack('<HHI', linktype, 0, snaplen) + options)
+
+    def _block(self, type, body):
+        body += bytes(-len(body) % 4)
+        length = len(body) + 12
+        self.f.write(struct.pack('<II', type, length) + body +
+                     struct.pack('<I', length))
+
+    def write(self, frame):
+        # enhanced packet block
+        ts = frame.timestamp
+        header = struct.pack('<IIIII', 0, ts >> 32, ts & 0xffffffff,
+                             len(frame.data),
+                             max(frame.length, len(frame.data)))
+        self._block(6, header + frame.data)
+
+
+WRITERS = {
+    'pcap': PcapWriter,
+    'pcapng': PcapngWriter,
+}
+
+
+class CaptureBuffer:
+    """Downloads the frames captured on a port.
+
+    The frames are read in segments of `segment_size` frames, one round trip
+    per segment, and handed out one by one. Thus, only one segment is held in
+    memory, regardless of the size of the capture.
+    """
+    # Loads the frames first..last into the captureBuffer and returns a flat
+    # list {nPackets numFrames timestamp length status data ..}, where data
+    # is the frame as hex string without spaces, so the reply can be split
+    # without a TCL list parser.
+    SEGMENT_SCRIPT = (
+        'proc __pyixia_capture {ch c p first last} {'
+        ' if {[set rc [capture get $ch $c $p]] != 0} {return -code error $rc};'
+        ' set n [capture cget -nPackets];'
+        ' if {$last > $n} {set last $n};'
+        ' if {$first > $last} {return [list $n 0]};'
+        ' if {[set rc [captureBuffer get $ch $c $p $first $last]] != 0} {'
+        '  return -code error $rc'
+        ' };'
+        ' set r [list $n [set m [captureBuffer cget -numFrames]]];'
+        ' for {set i 1} {$i <= $m} {incr i} {'
+        '  captureBuffer getframe $i;'
+        '  lappend r [captureBuffer cget -timestamp]'
+        '   [captureBuffer cget -length] [captureBuffer cget -status]'
+        '   [string map {{ } {}} [captureBuffer cget -frame]]'
+        ' };'
+        ' return $r'
+        '}; '
+        '__pyixia_capture %d %d %d %d %d'
+    )
+
+    def __init__(self, api, port, segment_size=None):
+        self._api = api
+        self.port = port
+        self.segment_size = segment_size or DEFAULT_SEGMENT_SIZE
+
+    def _segment(self, first, last):
+        words = self._api.call(self.SEGMENT_SCRIPT,
+                               *(self.port._port_id() + (first, last)))[0]
+        words = words.split()
+        frames = list()
+        for i in range(2, len(words), 4):
+            (timestamp, length, status, data) = words[i:i+4]
+            data = bytes.fromhex(data) if data != '{}' else b''
+            frames.append(Frame(int(timestamp), int(length), int(status),
+                                data))
+        return (int(words[0]), frames)
+
+    def frames(self, first=1, last=None):
+        """Yields the captured frames `first` to `last` (one-based,
+        inclusive), by default all of them."""
+        while last is None or first <= last:
+            end = first + self.segment_size - 1
+            if last is not None:
+                end = min(end, last)
+            (count, frames) = self._segment(first, end)
+            if last is None:
+                last = count
+            log.debug('Read frames %d-%d of %d of port %s', first,
+                      first + len(frames) - 1, count, self.port)
+            if not frames:
+                break
+            yield from frames
+            first += len(frames)
+
+    def save(self, path, format=None, first=1, last=None):
+        """Writes the captured frames to a file, either 'pcap' or 'pcapng'.
+        By default, the format is derived from the file name. Returns the
+        number of frames written."""
+        if format is None:
+            format = 'pcapng' if path.endswith('.pcapng') else 'pcap'
+        count = 0
+        with open(path, 'wb') as f:
+            writer = WRITERS[format](f)
+            for frame in self.frames(first, last):
+                writer.write(frame)
+                count += 1
+        return count
@@ -3,11 +3,15 @@
 # Copyright (c) 2015 Kontron Europe GmbH
 #
 
+import csv
+import json
 import logging
 import sys
+import threading
+import time
 import argparse
 
-from . import Ixia
+from . import Ixia, Port, TopologyCache
 from .ixapi import IxTclHalError
 from .helper import obj_match_attribute_value
 
@@ -19,37 +23,178 @@ ALLOWED_STATS = 'bytes_received bytes_sent \
         bits_received bits_sent \
         frames_received frames_sent \
         fcs_errors framer_fcs_errors fragments'.split()
+DEFAULT_WATCH_STATS = ['frames_sent', 'frames_received']
 
 
 def run_port_cmds(i, ports, cmds):
-    for pid in ports:
-        port = i.get_port(pid)
+    for port in i.get_ports(ports):
         for cmd in cmds:
             getattr(port, cmd)()
 
 
 def run_pg_cmds(pg, cmds):
-    for cmd in cmds:
-        getattr(pg, cmd)()
+    with pg._api.batch():
+        for cmd in cmds:
+            getattr(pg, cmd)()
+
+
+class CsvWriter:
+    """Writes rows as CSV with a header line."""
+    def __init__(self, fields, out=None):
+        self.out = out or sys.stdout
+        self._writer = csv.DictWriter(self.out, fields, lineterminator='\n')
+        self._writer.writeheader()
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self.out.flush()
+
+
+class JsonWriter:
+    """Writes rows as JSON lines, one object per row."""
+    def __init__(self, fields, out=None):
+        self.out = out or sys.stdout
+
+    def write(self, row):
+        self.out.write(json.dumps(row) + '\n')
+        self.out.flush()
+
 
+WRITERS = {
+    'csv': CsvWriter,
+    'jsonl': JsonWriter,
+}
 
-def print_stats(i, ports, stats):
+
+def print_stats(i, ports, stats, output='table'):
+    ports = i.get_ports(ports)
+    values = i.fetch_stats(ports, stats)
+    if output != 'table':
+        writer = WRITERS[output](['port'] + stats)
+        for port in ports:
+            writer.write(dict(port=str(port), **values[port]))
+        return
     fmt = '{!s:>8} ' + ' | {:<18}' * len(stats)
-    for pid in ports:
-        port = i.get_port(pid)
-        print(fmt.format(port, *map(lambda s: getattr(port.stats, s), stats)))
+    for port in ports:
+        print(fmt.format(port, *(values[port][s] for s in stats)))
 
 
-def print_ports(i):
-    print('%8s | %6s | %s' % ('Port', 'Link', 'Owner'))
-    print('---------+--------+-----------------')
+def format_si(value):
+    for prefix in ('', 'k', 'M', 'G'):
+        if abs(value) < 1000:
+            break
+        value /= 1000
+    return '%.1f%s' % (value, prefix)
+
+
+def format_watch(sampler):
+    """Returns the table of the latest sample with the counters, their
+    deltas and per second rates since the previous sample."""
+    sample = sampler.latest()
+    deltas = sampler.deltas() or dict()
+    rates = sampler.rates() or dict()
+    lines = ['%s  interval %.1fs  missed %d' %
+             (time.strftime('%H:%M:%S', time.localtime(sample.timestamp)),
+              sampler.interval, sampler.missed)]
+    header = '%8s ' % 'Port' + ''.join(' | %-38s' % s
+                                       for s in sampler.counters)
+    lines.append(header.rstrip())
+    lines.append('%8s ' % '' + ' | %15s %11s %10s' %
+                 ('total', 'delta', 'rate/s') * len(sampler.counters))
+    for port in sampler.ports:
+        cells = list()
+        for counter in sampler.counters:
+            delta = deltas.get(port, dict()).get(counter)
+            rate = rates.get(port, dict()).get(counter)
+            cells.append(' | %15d %11s %10s' %
+                         (sample.values[port][counter],
+                          '-' if delta is None else '%+d' % delta,
+                          '-' if rate is None else format_si(rate)))
+        lines.append('%8s ' % port + ''.join(cells))
+    return '\n'.join(lines)
+
+
+def watch_rows(sampler):
+    """Yields one row per port of the latest sample with the counters and
+    their per second rates."""
+    sample = sampler.latest()
+    rates = sampler.rates() or dict()
+    for port in sampler.ports:
+        row = dict(timestamp='%.3f' % sample.timestamp, port=str(port))
+        row.update(sample.values[port])
+        for counter in sampler.counters:
+            rate = rates.get(port, dict()).get(counter)
+            row[counter + '_rate'] = None if rate is None else round(rate, 3)
+        yield row
+
+
+def watch_stats(i, ports, stats, interval, output='table', count=None):
+    """Shows the statistics every `interval` seconds until interrupted or
+    `count` samples were shown. All counters of all ports are read in a single
+    round trip per refresh.
+
+    With an `output` other than 'table', one row per port and sample is
+    written as soon as the sample was taken."""
+    if ports:
+        ports = i.get_ports(ports)
+    else:
+        ports = sorted(i._port_index().values(), key=lambda p: p._port_id())
+    clear = '\033[H\033[2J' if sys.stdout.isatty() else ''
+    writer = None
+    if output != 'table':
+        fields = ['timestamp', 'port'] + stats + [s + '_rate' for s in stats]
+        writer = WRITERS[output](fields)
+    lock = threading.Lock()
+    done = threading.Event()
+    shown = [0]
+
+    def show(sample):
+        with lock:
+            if done.is_set():
+                return
+            if writer is None:
+                print(clear + format_watch(sampler), flush=True)
+            else:
+                for row in watch_rows(sampler):
+                    writer.write(row)
+            shown[0] += 1
+            if count is not None and shown[0] >= count:
+                done.set()
+
+    sampler = i.new_stats_sampler(ports, stats, interval, callback=show)
+    sampler.start()
+    try:
+        done.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.stop()
+
+
+def port_rows(i):
+    """Yields the link state and the owner of all ports. The values are read
+    in one round trip per card."""
+    members = [Port._ix_members['link_state'], Port._ix_members['owner']]
     for card in i.chassis.cards:
-        if card is None:
+        if card is None or not card.ports:
             continue
-        for port in card.ports:
+        values = i._api.fetch([(port, members) for port in card.ports])
+        for (port, (link_state, owner)) in zip(card.ports, values):
             state = obj_match_attribute_value(port, 'LINK_STATE_',
-                                              port.link_state)
-            print('%8s | %6s | %s' % (port, state.lower(), port.owner))
+                                              link_state)
+            yield dict(port=str(port), link=str(state).lower(), owner=owner)
+
+
+def print_ports(i, output='table'):
+    if output != 'table':
+        writer = WRITERS[output](['port', 'link', 'owner'])
+        for row in port_rows(i):
+            writer.write(row)
+        return
+    print('%8s | %6s | %s' % ('Port', 'Link', 'Owner'))
+    print('---------+--------+-----------------')
+    for row in port_rows(i):
+        print('%(port)8s | %(link)6s | %(owner)s' % row)
 
 
 def main():
@@ -57,7 +202,8 @@ def main():
     parser.add_argument('url',
                         help='URL to connect to', metavar='URL')
     parser.add_argument('ports', nargs='*',
-                        help='operate on these ports', metavar='PORTS')
+                        help='operate on these ports, eg. 1/1/1 or 1/2/1-4',
+                        metavar='PORTS')
     parser.add_argument('-v', action='store_true', dest='verbose',
                         help='be more verbose')
     parser.add_argument('-d', action='store_true', dest='debug',
@@ -73,6 +219,28 @@ def main():
     parser.add_argument('-s', '--stats', dest='stats',
                         choices=ALLOWED_STATS, action='append',
                         help='show statistics', metavar='STAT')
+    parser.add_argument('-w', '--watch', dest='watch', type=float,
+                        nargs='?', const=1.0, metavar='SECONDS',
+                        help='refresh the statistics every SECONDS seconds '
+                        '(default 1) and show their rates')
+    parser.add_argument('-n', '--count', dest='count', type=int,
+                        metavar='N', help='stop watching after N samples')
+    parser.add_argument('-o', '--output', dest='output', default='table',
+                        choices=['table'] + sorted(WRITERS),
+                        help='output format, csv and jsonl write one line '
+                        'per port (and sample)')
+    parser.add_argument('--rediscover', action='store_true',
+                        dest='rediscover',
+                        help='discover the chassis even if it is cached')
+    parser.add_argument('--no-cache', action='store_false', dest='cache',
+                        help='don\'t use the topology cache')
+    parser.add_argument('--record', dest='record', metavar='FILE',
+                        help='record all requests and replies to a trace')
+    parser.add_argument('--replay', dest='replay', metavar='FILE',
+                        help='replay a trace instead of connecting')
+    parser.add_argument('--replay-timing', action='store_true',
+                        dest='replay_timing',
+                        help='replay the trace with the recorded latencies')
 
     args = parser.parse_args()
 
@@ -83,12 +251,18 @@ def main():
         logging.getLogger('').setLevel(logging.DEBUG)
 
     try:
-        i = Ixia(args.url)
+        i = Ixia(args.url,
+                 topology_cache=TopologyCache() if args.cache else None,
+                 record=args.record, replay=args.replay,
+                 replay_timing=args.replay_timing)
         i.connect()
-        i.discover()
+        i.discover(args.rediscover)
+
+        if args.watch is not None and not args.stats:
+            args.stats = DEFAULT_WATCH_STATS
 
         if not args.port_cmds and not args.pg_cmds and not args.stats:
-            print_ports(i)
+            print_ports(i, args.output)
             i.disconnect()
             sys.exit(0)
 
@@ -98,17 +272,14 @@ def main():
             run_port_cmds(i, args.ports, args.port_cmds)
 
         if args.pg_cmds:
-            pg = i.new_port_group()
-            pg.create()
-            for port in args.ports:
-                pg.add_port(i.get_port(port))
-
+            pg = i.port_groups.get(i.get_ports(args.ports))
             run_pg_cmds(pg, args.pg_cmds)
 
-            pg.destroy()
-
-        if args.stats:
-            print_stats(i, args.ports, args.stats)
+        if args.watch is not None:
+            watch_stats(i, args.ports, args.stats, args.watch, args.output,
+                        args.count)
+        elif args.stats:
+            print_stats(i, args.ports, args.stats, args.output)
 
         i.disconnect()
     except IxTclHalError as e:
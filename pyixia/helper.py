@@ -9,3 +9,98 @@ def obj_match_attribute_value(obj, prefix, value):
             if value == getattr(obj, attr):
                 return attr[len(prefix):]
     return value
+
+
+_TCL_SPECIAL_CHARS = set(' \t\n\r\v\f;"$[]{}\\')
+_TCL_BACKSLASH_MAP = {
+    'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n',
+    'r': '\r', 't': '\t', 'v': '\v',
+}
+
+
+def tcl_quote(value):
+    """Quotes a value so it is passed as exactly one word to a TCL command."""
+    s = str(value)
+    if s == '':
+        return '{}'
+    if not any(c in _TCL_SPECIAL_CHARS for c in s):
+        return s
+    quoted = []
+    for c in s:
+        if c == '\n':
+            quoted.append('\\n')
+        elif c == '\r':
+            quoted.append('\\r')
+        elif c in _TCL_SPECIAL_CHARS:
+            quoted.extend(('\\', c))
+        else:
+            quoted.append(c)
+    return ''.join(quoted)
+
+
+def _tcl_backslash(s, i):
+    """Substitutes the backslash sequence at s[i], returns (char, next)."""
+    c = s[i+1:i+2]
+    if c in _TCL_BACKSLASH_MAP:
+        return _TCL_BACKSLASH_MAP[c], i + 2
+    if c == '\n':
+        return ' ', i + 2
+    return c, i + 2
+
+
+def tcl_list_split(s):
+    """Splits a well formed TCL list, eg. the result of the `list` command,
+    into its elements. Nested lists are returned as strings."""
+    elements = list()
+    i = 0
+    n = len(s)
+    while True:
+        while i < n and s[i].isspace():
+            i += 1
+        if i >= n:
+            break
+        if s[i] == '{':
+            depth = 1
+            start = i = i + 1
+            while i < n:
+                if s[i] == '\\':
+                    i += 1
+                elif s[i] == '{':
+                    depth += 1
+                elif s[i] == '}':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            if depth != 0:
+                raise ValueError('unmatched open brace in list')
+            elements.append(s[start:i])
+            i += 1
+        elif s[i] == '"':
+            i += 1
+            element = list()
+            while i < n and s[i] != '"':
+                if s[i] == '\\':
+                    c, i = _tcl_backslash(s, i)
+                    element.append(c)
+                else:
+                    element.append(s[i])
+                    i += 1
+            if i >= n:
+                raise ValueError('unmatched open quote in list')
+            elements.append(''.join(element))
+            i += 1
+        else:
+            element = list()
+            while i < n and not s[i].isspace():
+                if s[i] == '\\':
+                    c, i = _tcl_backslash(s, i)
+                    element.append(c)
+                else:
+                    element.append(s[i])
+                    i += 1
+            elements.append(''.join(element))
+        if i < n and not s[i].isspace():
+            raise ValueError('list element followed by "%s" instead of space'
+                             % s[i])
+    return elements
@@ -0,0 +1,195 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import math
+import os.path
+import re
+import sys
+import threading
+import time
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+# modules of the protocol layers, which are never reported as caller
+_INTERNAL_MODULES = ('pyixia.ixapi', 'pyixia.tclproto', 'pyixia.pool',
+                     'pyixia.instrument')
+
+# latencies are collected in buckets of a quarter octave, starting at 1us
+_BUCKETS_PER_OCTAVE = 4
+_MIN_LATENCY = 1e-6
+
+
+def _property_name(obj, member, accessor):
+    # the getters and setters created by _MetaIxTclApi, the setter is
+    # reported as 'attrname='
+    for (attrname, m) in getattr(type(obj), '_ix_members', dict()).items():
+        if m is member:
+            return attrname if accessor == 'fget' else attrname + '='
+    return accessor
+
+
+def _caller():
+    """Returns the name of the outermost method of a pyixia object on the
+    stack, eg. 'Port.link_state', or None."""
+    caller = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(_PACKAGE_DIR):
+            obj = frame.f_locals.get('self')
+            if (obj is not None and
+                    type(obj).__module__ not in _INTERNAL_MODULES):
+                name = code.co_name
+                if name in ('fget', 'fset'):
+                    name = _property_name(obj, frame.f_locals.get('m'), name)
+                caller = '%s.%s' % (type(obj).__name__, name)
+        frame = frame.f_back
+    return caller
+
+
+def _verb(data):
+    """Returns the IxTclHal command and subcommand of a request, eg. 'port
+    get'. The scripts of IxTclHalApi.fetch() and .batch() are reported as
+    'fetch' and 'batch', server side procedures like the discovery by their
+    name."""
+    if data.startswith('list ['):
+        return 'fetch'
+    if data.startswith('set __pyixia_r '):
+        return 'batch'
+    m = re.match(r'proc __pyixia_(\w+)', data)
+    if m is not None:
+        return m.group(1)
+    words = data.split(None, 2)
+    if len(words) > 1 and re.match(r'[A-Za-z]\w*$', words[1]):
+        return ' '.join(words[:2])
+    return words[0] if words else ''
+
+
+class Histogram:
+    """Latency histogram with logarithmic buckets, which are a quarter
+    octave wide. Thus, percentiles have a resolution of about 19%."""
+    def __init__(self):
+        self.buckets = dict()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        if value <= _MIN_LATENCY:
+            bucket = 0
+        else:
+            bucket = math.ceil(math.log2(value / _MIN_LATENCY) *
+                               _BUCKETS_PER_OCTAVE)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """Returns the upper bound of the bucket which contains the q-th
+        percentile (0 < q <= 100)."""
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * q / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                bound = _MIN_LATENCY * 2 ** (bucket / _BUCKETS_PER_OCTAVE)
+                return min(bound, self.max)
+        return self.max
+
+
+class _Entry:
+    def __init__(self):
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = Histogram()
+
+    def as_dict(self):
+        return dict(count=self.latency.count, bytes_sent=self.bytes_sent,
+                    bytes_received=self.bytes_received,
+                    total_time=self.latency.total,
+                    p50=self.latency.percentile(50),
+                    p99=self.latency.percentile(99),
+                    max=self.latency.max)
+
+
+class Instrumentation:
+    """Records the round trips of an :class:`pyixia.ixapi.IxTclHalApi`.
+
+    For every request, the latency and the bytes sent and received are
+    accounted to the calling pyixia method (eg. 'Port.link_state', 'Port.name='
+    for the setter or None for calls outside of pyixia objects) and the
+    command (eg. 'port get'). Use :meth:`pyixia.ixapi.IxTclHalApi.instrument`
+    to enable it.
+    """
+    def __init__(self):
+        self._entries = dict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def io(self, sent, received):
+        """Called by the transports for every request and reply."""
+        counters = getattr(self._local, 'io', None)
+        if counters is not None:
+            counters[0] += sent
+            counters[1] += received
+
+    def _measure(self, verb, fn, *args):
+        counters = self._local.io = [0, 0]
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._local.io = None
+            self.record(_caller(), verb, elapsed, *counters)
+
+    def call(self, handler, cmd, args):
+        return self._measure(_verb(cmd % args), handler.call, cmd, *args)
+
+    def call_many(self, handler, cmds, return_exceptions):
+        return self._measure('call_many', handler.call_many, cmds,
+                             return_exceptions)
+
+    def record(self, caller, verb, latency, sent=0, received=0):
+        with self._lock:
+            entry = self._entries.get((caller, verb))
+            if entry is None:
+                entry = self._entries[(caller, verb)] = _Entry()
+            entry.bytes_sent += sent
+            entry.bytes_received += received
+            entry.latency.add(latency)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+    def report(self):
+        """Returns a dict which maps the callers to dicts, which map the
+        commands to their counters. The latencies are in seconds."""
+        report = dict()
+        with self._lock:
+            for ((caller, verb), entry) in self._entries.items():
+                report.setdefault(caller, dict())[verb] = entry.as_dict()
+        return report
+
+    def format(self):
+        """Returns the report as a table, the most expensive callers first."""
+        rows = list()
+        for (caller, verbs) in self.report().items():
+            for (verb, e) in verbs.items():
+                rows.append((str(caller), verb, e))
+        rows.sort(key=lambda r: -r[2]['total_time'])
+        lines = ['%-32s %-20s %7s %10s %10s %9s %9s' %
+                 ('caller', 'command', 'count', 'sent', 'received',
+                  'p50 [ms]', 'p99 [ms]')]
+        for (caller, verb, e) in rows:
+            lines.append('%-32s %-20s %7d %10d %10d %9.3f %9.3f' %
+                         (caller, verb, e['count'], e['bytes_sent'],
+                          e['bytes_received'], e['p50'] * 1e3,
+                          e['p99'] * 1e3))
+        return '\n'.join(lines)
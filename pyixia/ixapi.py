@@ -40,10 +40,22 @@ Note that there is only one temporary storage for each command.
 
 """
 
-from .helper import obj_match_attribute_value
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+
+from .helper import obj_match_attribute_value, tcl_list_split, tcl_quote
+from .instrument import Instrumentation
+from .tclproto import _tcl_error
 
 FLAG_RDONLY = 1
 
+# Caching policies of a TclMember. A positive number is the time to live of
+# a cached value in seconds.
+CACHE_NEVER = 0
+CACHE_STATIC = -1
+
 
 def two_chars(s):
     for i in range(len(s)-1):
@@ -73,12 +85,87 @@ def translate_ix_member_name(name):
 
 
 class TclMember:
-    def __init__(self, name, type=str, attrname=None, flags=0, doc=None):
+    def __init__(self, name, type=str, attrname=None, flags=0, doc=None,
+                 cache=CACHE_NEVER):
         self.name = name
         self.type = type
         self.attrname = attrname
         self.flags = flags
         self.doc = doc
+        self.cache = cache
+
+
+@contextmanager
+def _configure(self, write=False):
+    """Collects all member changes within the context and applies them at
+    once when the context is left.
+
+    Only members whose value actually changed are configured. The `get`, all
+    `config` commands, the `set` and, if `write` is True, the `write` are sent
+    in a single round trip. If any of the staged members are not cached, their
+    current values are fetched in one additional round trip.
+    """
+    if write and not hasattr(self, '_ix_write_cmd'):
+        raise RuntimeError('%s does not support write' %
+                           self.__class__.__name__)
+    if self.__dict__.get('_ix_staged') is not None:
+        raise RuntimeError('configure() cannot be nested')
+    self._ix_staged = dict()
+    try:
+        yield self
+        staged = self._ix_staged
+    finally:
+        self._ix_staged = None
+
+    values = dict()
+    fetch = list()
+    for m in staged:
+        (hit, val) = _cache_get(self, m)
+        if hit:
+            values[m] = val
+        else:
+            fetch.append(m)
+    if fetch:
+        values.update(zip(fetch, self._api.fetch([(self, fetch)])[0]))
+
+    changed = [(m, val) for (m, val) in staged.items() if val != values[m]]
+    if not changed:
+        return
+
+    with self._api.batch():
+        get = self._ix_get_cmd(None)
+        if get is not None:
+            self._api.call_rc(get)
+        for (m, val) in changed:
+            self._api.call('%s config -%s %s', self.__tcl_command__, m.name,
+                           tcl_quote(val))
+        self._api.call_rc(self._ix_set_cmd())
+        if write:
+            self._api.call(self._ix_write_cmd())
+    for (m, val) in changed:
+        _cache_put(self, m, val)
+
+
+def _cache_get(obj, member):
+    """Returns a tuple (hit, value) for a cached member."""
+    try:
+        (value, expires) = obj._ix_cache[member.name]
+    except (AttributeError, KeyError):
+        return (False, None)
+    if expires is not None and time.monotonic() >= expires:
+        return (False, None)
+    return (True, value)
+
+
+def _cache_put(obj, member, value):
+    if member.cache == CACHE_NEVER:
+        return
+    if member.cache == CACHE_STATIC:
+        expires = None
+    else:
+        expires = time.monotonic() + member.cache
+    obj.__dict__.setdefault('_ix_cache', dict())[member.name] = (value,
+                                                                 expires)
 
 
 class IxTclHalError(Exception):
@@ -91,30 +178,307 @@ class IxTclHalError(Exception):
     IXTCL_ADDED_AS_DISABLED = 103
     IXTCL_HARDWARE_CONFLICT = 202
 
-    def __init__(self, rc):
+    def __init__(self, rc, cmd=None):
         self.rc = rc
+        self.cmd = cmd
 
     def __repr__(self):
         return '%s(rc=%d)' % (self.__class__.__name__, self.rc)
 
     def __str__(self):
         desc = obj_match_attribute_value(self, "IXTCL_", self.rc)
-        desc = desc.lower().replace('_', ' ')
+        desc = str(desc).lower().replace('_', ' ')
         return '%s: %s (%d)' % (self.__class__.__name__, desc, self.rc)
 
 
+class BatchResult:
+    """Deferred result of a command which was issued within a batch."""
+    def __init__(self, cmd, check_rc):
+        self.cmd = cmd
+        self.check_rc = check_rc
+        self.done = False
+        self._result = None
+        self._exc = None
+
+    def _resolve(self, code, result):
+        self.done = True
+        if code != 0:
+            self._exc = _tcl_error(result)
+        elif self.check_rc and result != '0':
+            self._exc = IxTclHalError(int(result), self.cmd)
+        else:
+            self._result = (result, None)
+
+    def _skip(self):
+        self.done = True
+        self._exc = RuntimeError('Not executed due to a previous error '
+                                 'within the batch')
+
+    def succeeded(self):
+        """Returns True if the command was executed without an error."""
+        return self.done and self._exc is None
+
+    def result(self):
+        if not self.done:
+            raise RuntimeError('Result of a batched command is not available '
+                               'until the batch is executed')
+        if self._exc is not None:
+            raise self._exc
+        return self._result
+
+    def __getitem__(self, index):
+        return self.result()[index]
+
+
+class Batch:
+    """Collects commands and executes them in a single round trip.
+
+    All commands are wrapped into one TCL script, which catches the result of
+    every command and returns a list of (TCL return code, result) pairs. Like
+    with a sequence of single calls, the execution stops at the first command
+    which fails.
+    """
+    def __init__(self, api):
+        self._api = api
+        self.results = list()
+
+    def call(self, cmd, *args):
+        r = BatchResult(cmd % args, check_rc=False)
+        self.results.append(r)
+        return r
+
+    def call_rc(self, cmd, *args):
+        r = BatchResult(cmd % args, check_rc=True)
+        self.results.append(r)
+        return r
+
+    def _script(self):
+        script = ['set __pyixia_r {};']
+        script.append('foreach __pyixia_i 1 {')
+        for r in self.results:
+            script.append('lappend __pyixia_r [set __pyixia_c [catch %s '
+                          '__pyixia_x]] $__pyixia_x;' % tcl_quote(r.cmd))
+            if r.check_rc:
+                script.append('if {$__pyixia_c || $__pyixia_x != 0} break;')
+            else:
+                script.append('if {$__pyixia_c} break;')
+        script.append('}; set __pyixia_r')
+        return ' '.join(script)
+
+    def execute(self):
+        """Executes all collected commands and raises the error of the
+        first failing command."""
+        if not self.results:
+            return
+        reply = tcl_list_split(self._api._tcl_call('%s', self._script())[0])
+        for (n, r) in enumerate(self.results):
+            if 2*n < len(reply):
+                r._resolve(int(reply[2*n]), reply[2*n+1])
+            else:
+                r._skip()
+        for r in self.results:
+            if r._exc is not None:
+                raise r._exc
+
+
 class IxTclHalApi:
     def __init__(self, tcl_handler):
         self._tcl_handler = tcl_handler
+        self._local = threading.local()
+        self._pinned = None
+        self.instrumentation = None
+        if getattr(tcl_handler, 'thread_safe', False):
+            self._lock = nullcontext()
+        else:
+            self._lock = threading.RLock()
+
+    def _tcl_call(self, cmd, *args):
+        # The TCL handler might be shared with other threads, eg. a
+        # StatsSampler. Make sure request and reply are not interleaved.
+        with self._lock:
+            if self.instrumentation is None:
+                return self._tcl_handler.call(cmd, *args)
+            return self.instrumentation.call(self._tcl_handler, cmd, args)
+
+    @contextmanager
+    def exclusive(self):
+        """Makes sure a sequence of calls, eg. `port config` and `port set`,
+        is not interleaved with calls of other threads.
+
+        If the TCL handler is a :class:`pyixia.pool.TclConnectionPool`, one
+        connection is bound to the current thread. Otherwise the connection
+        is locked for the duration of the context.
+        """
+        connection = getattr(self._tcl_handler, 'connection', None)
+        if connection is not None:
+            with connection():
+                yield
+        else:
+            with self._lock:
+                yield
+
+    def pinned(self):
+        """Returns an API which always uses the same connection.
+
+        State which belongs to one connection of the TclServer, like port
+        groups, has to be used through such an API. With a
+        :class:`pyixia.pool.TclConnectionPool`, this is its dedicated
+        connection. Otherwise there is only one connection and the API itself
+        is returned.
+        """
+        if self._pinned is None:
+            dedicated_client = getattr(self._tcl_handler, 'dedicated_client',
+                                       None)
+            if dedicated_client is None:
+                return self
+            self._pinned = IxTclHalApi(dedicated_client())
+        self._pinned.instrumentation = self.instrumentation
+        return self._pinned
+
+    def reset_connections(self):
+        """Makes sure all pooled connections are set up again, eg. after
+        the login changed."""
+        invalidate = getattr(self._tcl_handler, 'invalidate', None)
+        if invalidate is not None:
+            invalidate()
 
     def call(self, cmd, *args):
-        return self._tcl_handler.call(cmd, *args)
+        batch = getattr(self._local, 'batch', None)
+        if batch is not None:
+            return batch.call(cmd, *args)
+        return self._tcl_call(cmd, *args)
 
     def call_rc(self, cmd, *args):
+        batch = getattr(self._local, 'batch', None)
+        if batch is not None:
+            return batch.call_rc(cmd, *args)
         rc = int(self.call(cmd, *args)[0])
         if rc != 0:
             raise IxTclHalError(rc)
 
+    @contextmanager
+    def batch(self):
+        """Defers all `call` and `call_rc` invocations of the current thread
+        and executes them in one round trip when the context is left.
+
+        Within the context, the calls return :class:`BatchResult` objects.
+        Thus, only methods which don't evaluate the result of a command
+        immediately, like `Port.factory_defaults()` or `PortGroup.add_port()`,
+        can be used. Nested batches are merged into the outermost one.
+        """
+        batch = getattr(self._local, 'batch', None)
+        if batch is not None:
+            yield batch
+            return
+
+        batch = Batch(self)
+        self._local.batch = batch
+        try:
+            yield batch
+        finally:
+            self._local.batch = None
+        batch.execute()
+
+    def call_many(self, cmds, return_exceptions=False):
+        with self._lock:
+            if self.instrumentation is None:
+                return self._tcl_handler.call_many(cmds, return_exceptions)
+            return self.instrumentation.call_many(self._tcl_handler, cmds,
+                                                  return_exceptions)
+
+    @contextmanager
+    def instrument(self, instrumentation=None):
+        """Records the latency and size of all round trips within the
+        context and returns the :class:`pyixia.instrument.Instrumentation`::
+
+            with api.instrument() as i:
+                port.link_state
+            print(i.format())
+        """
+        if instrumentation is None:
+            instrumentation = Instrumentation()
+        prev = self.instrumentation
+        self.instrumentation = instrumentation
+        self._tcl_handler.instrumentation = instrumentation
+        try:
+            yield instrumentation
+        finally:
+            self.instrumentation = prev
+            self._tcl_handler.instrumentation = prev
+
+    def fetch(self, requests):
+        """Fetches several members of several objects in one round trip.
+
+        `requests` is a list of `(obj, members)` tuples, where `obj` is an
+        instance of a class created by :class:`_MetaIxTclApi` and `members` a
+        list of its :class:`TclMember`. The `get` command of each object and
+        the `cget` of each member are combined into a single TCL script.
+
+        Returns a list with a list of typed values for each request.
+        """
+        script = _fetch_script(requests)
+        if script is None:
+            return [list() for r in requests]
+        return _fetch_values(requests, self.call('%s', script)[0])
+
+
+class AsyncIxTclHalApi:
+    """asyncio variant of :class:`IxTclHalApi` which is used together with
+    :class:`pyixia.tclproto.AsyncTclSocketClient`."""
+    def __init__(self, tcl_handler):
+        self._tcl_handler = tcl_handler
+
+    async def call(self, cmd, *args):
+        return await self._tcl_handler.call(cmd, *args)
+
+    async def call_rc(self, cmd, *args):
+        rc = int((await self.call(cmd, *args))[0])
+        if rc != 0:
+            raise IxTclHalError(rc)
+
+    async def call_many(self, cmds, return_exceptions=False):
+        return await self._tcl_handler.call_many(cmds, return_exceptions)
+
+    async def fetch(self, requests):
+        """See :meth:`IxTclHalApi.fetch`."""
+        script = _fetch_script(requests)
+        if script is None:
+            return [list() for r in requests]
+        return _fetch_values(requests, (await self.call('%s', script))[0])
+
+
+def _fetch_script(requests):
+    words = list()
+    for (obj, members) in requests:
+        last_get = None
+        for m in members:
+            get = obj._ix_get_cmd(m)
+            if get is not None and get != last_get:
+                words.append('[%s]' % get)
+                last_get = get
+            words.append('[%s cget -%s]' % (obj.__tcl_command__, m.name))
+    if not words:
+        return None
+    return 'list ' + ' '.join(words)
+
+
+def _fetch_values(requests, reply):
+    values = iter(tcl_list_split(reply))
+    result = list()
+    for (obj, members) in requests:
+        last_get = None
+        obj_values = list()
+        for m in members:
+            get = obj._ix_get_cmd(m)
+            if get is not None and get != last_get:
+                rc = int(next(values))
+                if rc != 0:
+                    raise IxTclHalError(rc)
+                last_get = get
+            obj_values.append(m.type(next(values)))
+        result.append(obj_values)
+    return result
+
 
 class _MetaIxTclApi(type):
     """Dynamically creates properties, which wraps the IxTclHAL API.
@@ -129,28 +493,63 @@ class _MetaIxTclApi(type):
     The generated methods assume that the class provides a method called
     '_ix_get' which fetches the properties and stores them into the IxTclHal
     object. Eg.  for the 'port' command this would be 'port get <ch> <card>
-    <port>'.
+    <port>'. '_ix_get_cmd' has to return this command as a string (or None if
+    there is no such command), it is used to fetch all members at once.
+
+    Additionally, a 'snapshot' method is created which reads all members in a
+    single round trip and returns them as an immutable record of the type
+    `<clsname>.Snapshot`. The `_ix_members` class attribute maps the attribute
+    names to their :class:`TclMember`.
+
+    Members with a caching policy other than `CACHE_NEVER` are cached on the
+    object, either forever (`CACHE_STATIC`) or for the given number of
+    seconds. Values which are written through a property are cached as well.
+    'invalidate' drops cached values and 'refresh' reads all cached members
+    again in a single round trip.
+
+    If the class provides '_ix_set_cmd' (and optionally '_ix_write_cmd'), a
+    'configure' context manager is created, which stages all changes to the
+    members and applies them at once.
     """
     def __new__(cls, clsname, clsbases, clsdict):
         members = clsdict.get('__tcl_members__', list())
         command = clsdict.get('__tcl_command__', None)
+        attrnames = list()
         for (n, m) in enumerate(members):
             if not isinstance(m, TclMember):
                 raise RuntimeError('Element #%d of __tcl_members__ is not a '
                                    'TclMember' % (n+1,))
 
             def fget(self, cmd=command, m=m):
-                self._ix_get(m)
-                val = self._api.call('%s cget -%s' % (cmd, m.name))[0]
-                return m.type(val)
+                staged = self.__dict__.get('_ix_staged')
+                if staged is not None and m in staged:
+                    return staged[m]
+                if m.cache != CACHE_NEVER:
+                    (hit, val) = _cache_get(self, m)
+                    if hit:
+                        return val
+                with self._api.exclusive():
+                    self._ix_get(m)
+                    val = self._api.call('%s cget -%s', cmd, m.name)[0]
+                val = m.type(val)
+                _cache_put(self, m, val)
+                return val
 
             def fset(self, value, cmd=command, m=m):
-                self._api.call('%s config -%s %s' % (cmd, m.name, value))
-                self._ix_set(m)
+                staged = self.__dict__.get('_ix_staged')
+                if staged is not None:
+                    staged[m] = m.type(value)
+                    return
+                with self._api.exclusive():
+                    self._api.call('%s config -%s %s', cmd, m.name,
+                                   tcl_quote(value))
+                    self._ix_set(m)
+                _cache_put(self, m, m.type(value))
 
             attrname = m.attrname
             if m.attrname is None:
                 attrname = translate_ix_member_name(m.name)
+            attrnames.append(attrname)
 
             if m.doc is not None:
                 fget.__doc__ = m.doc
@@ -165,5 +564,50 @@ class _MetaIxTclApi(type):
                 p = property(fget=fget)
 
             clsdict[attrname] = p
+
+        if members:
+            record = namedtuple('%sSnapshot' % clsname, attrnames)
+
+            def snapshot(self, members=members, record=record):
+                """Returns the values of all members, read in a single round
+                trip."""
+                values = self._api.fetch([(self, members)])[0]
+                for (m, val) in zip(members, values):
+                    _cache_put(self, m, val)
+                return record(*values)
+
+            def invalidate(self, *attrnames):
+                """Drops the cached values of the given members, or of all
+                members if none is given."""
+                cache = self.__dict__.get('_ix_cache', dict())
+                if not attrnames:
+                    cache.clear()
+                for attrname in attrnames:
+                    cache.pop(self._ix_members[attrname].name, None)
+
+            cached = [m for m in members if m.cache != CACHE_NEVER]
+
+            def refresh(self, members=cached):
+                """Reads all cached members again in a single round
+                trip."""
+                if not members:
+                    return
+                values = self._api.fetch([(self, members)])[0]
+                for (m, val) in zip(members, values):
+                    _cache_put(self, m, val)
+
+            def _ix_cache_update(self, **values):
+                for (attrname, val) in values.items():
+                    m = self._ix_members[attrname]
+                    _cache_put(self, m, m.type(val))
+
+            clsdict['Snapshot'] = record
+            clsdict['snapshot'] = snapshot
+            clsdict['invalidate'] = invalidate
+            clsdict['refresh'] = refresh
+            clsdict['_ix_cache_update'] = _ix_cache_update
+            if '_ix_set_cmd' in clsdict:
+                clsdict['configure'] = _configure
+            clsdict['_ix_members'] = dict(zip(attrnames, members))
         t = type.__new__(cls, clsname, clsbases, clsdict)
         return t
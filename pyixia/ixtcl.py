@@ -6,10 +6,10 @@
 import sys
 import logging
 import readline
-from urllib.parse import urlparse
 from optparse import OptionParser
 
-from .tclproto import TclSSHClient, TclSocketClient, TclError
+from .tclproto import TclError
+from .transports import client_from_url
 
 
 def main():
@@ -30,19 +30,15 @@ def main():
         print(parser.format_help())
         sys.exit(1)
 
-    o = urlparse(args[0], scheme='socket')
-    host = o.netloc or o.path
-    if o.scheme == 'socket':
-        tcl = TclSocketClient(host)
-    elif o.scheme == 'ssh':
-        tcl = TclSSHClient(host)
-    else:
-        print('Unknown URL scheme "%s"' % o.scheme)
+    try:
+        tcl = client_from_url(args[0])
+    except RuntimeError as e:
+        print(e)
         sys.exit(1)
 
     tcl.connect()
     if options.autoconnect:
-        print(tcl.call('ixConnectToChassis %s', host)[1])
+        print(tcl.call('ixConnectToChassis %s', tcl.host)[1])
 
     print("Enter command to send. Quit with 'q'.")
     try:
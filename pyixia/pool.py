@@ -0,0 +1,247 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import collections
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .tclproto import TclClient, TclError
+
+log = logging.getLogger(__name__)
+
+
+class TclConnectionPool(TclClient):
+    """A bounded pool of TclServer connections.
+
+    The TclServer has only one temporary storage per command and connection,
+    thus sequences like `port config`/`port set` must not be interleaved with
+    other threads on the same connection. The pool hands out one connection
+    per thread; within :meth:`connection` all calls of a thread use the same
+    connection, otherwise every call checks out an arbitrary idle connection.
+
+    `factory` returns a new, unconnected client, eg. a
+    :class:`pyixia.tclproto.TclSocketClient`. `setup` is called with every
+    new connection after it was connected. If the state which `setup`
+    establishes changes, eg. after a login, :meth:`invalidate` replaces all
+    connections. Connections which were idle for more than `max_idle` seconds
+    are checked before they are handed out.
+
+    State which lives in one connection of the TclServer, like port groups,
+    is kept on an additional connection, see :meth:`dedicated`. Waiting for
+    a connection raises a :class:`TimeoutError` after `timeout` seconds.
+    """
+    thread_safe = True
+
+    def __init__(self, factory, size=4, setup=None, max_idle=30,
+                 timeout=60):
+        self.factory = factory
+        self.size = size
+        self.setup = setup
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = collections.deque()
+        self._generation = 0
+        self._generations = dict()
+        self._dedicated = None
+        self._dedicated_lock = threading.RLock()
+        self._count = 0
+        self._closed = True
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+    def _create(self):
+        with self._cond:
+            generation = self._generation
+        client = self.factory()
+        client.connect()
+        try:
+            if self.setup is not None:
+                self.setup(client)
+        except Exception:
+            client.close()
+            raise
+        with self._cond:
+            self._generations[client] = generation
+        return client
+
+    def _healthy(self, client):
+        try:
+            client.call('info tclversion')
+            return True
+        except (OSError, EOFError, TclError):
+            log.info('Discarding broken connection')
+            return False
+
+    def checkout(self, timeout=None):
+        """Returns a connection, blocks until one is available if the pool is
+        exhausted. By default, it waits up to `self.timeout` seconds."""
+        if timeout is None:
+            timeout = self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError('TclClient is not connected')
+                if self._idle:
+                    (client, since) = self._idle.pop()
+                    break
+                if self._count < self.size:
+                    self._count += 1
+                    client = None
+                    break
+                if not self._cond.wait(timeout):
+                    raise TimeoutError('No connection available')
+
+        try:
+            if client is None:
+                return self._create()
+            if time.monotonic() - since <= self.max_idle:
+                return client
+            if self._healthy(client):
+                return client
+            self._close(client)
+            return self._create()
+        except BaseException:
+            with self._cond:
+                self._count -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, client, discard=False):
+        """Returns a connection to the pool. Broken connections have to be
+        discarded."""
+        with self._cond:
+            stale = self._generations.get(client) != self._generation
+            if discard or stale or self._closed:
+                self._count -= 1
+                self._close(client)
+            else:
+                self._idle.append((client, time.monotonic()))
+            self._cond.notify()
+
+    def _close(self, client):
+        self._generations.pop(client, None)
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def invalidate(self):
+        """Closes the idle connections and the busy ones when they are
+        returned. Thus, every connection is set up again."""
+        with self._cond:
+            self._generation += 1
+            while self._idle:
+                (client, since) = self._idle.pop()
+                self._count -= 1
+                self._close(client)
+            self._cond.notify_all()
+
+    @contextmanager
+    def dedicated(self):
+        """Binds the dedicated connection of the pool to the current thread
+        for the duration of the context.
+
+        The dedicated connection doesn't count against `size` and is kept
+        until the pool is closed. After :meth:`invalidate`, it is set up
+        again instead of being replaced, so its state is not lost.
+        """
+        if not self._dedicated_lock.acquire(timeout=self.timeout):
+            raise TimeoutError('Dedicated connection not available')
+        try:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError('TclClient is not connected')
+                generation = self._generation
+            client = self._dedicated
+            if client is not None and getattr(client, 'broken', False):
+                log.info('Replacing broken dedicated connection')
+                self._close(client)
+                client = self._dedicated = None
+            if client is None:
+                client = self._dedicated = self._create()
+            elif self._generations.get(client) != generation:
+                if self.setup is not None:
+                    self.setup(client)
+                with self._cond:
+                    self._generations[client] = generation
+            client.instrumentation = self.instrumentation
+            yield client
+        finally:
+            self._dedicated_lock.release()
+
+    def dedicated_client(self):
+        """Returns a client whose calls all use the dedicated
+        connection."""
+        return _DedicatedClient(self)
+
+    @contextmanager
+    def connection(self):
+        """Binds one connection to the current thread for the duration of the
+        context. Nested contexts use the same connection."""
+        client = getattr(self._local, 'client', None)
+        if client is not None:
+            yield client
+            return
+
+        client = self.checkout()
+        client.instrumentation = self.instrumentation
+        self._local.client = client
+        discard = False
+        try:
+            yield client
+        except (OSError, EOFError):
+            discard = True
+            raise
+        finally:
+            self._local.client = None
+            self.checkin(client, discard or getattr(client, 'broken', False))
+
+    def call(self, string, *args):
+        with self.connection() as client:
+            return client.call(string, *args)
+
+    def call_many(self, cmds, return_exceptions=False):
+        with self.connection() as client:
+            return client.call_many(cmds, return_exceptions)
+
+    def connect(self):
+        """Opens the first connection to make sure the TclServer is
+        reachable."""
+        with self._cond:
+            self._closed = False
+        self.checkin(self.checkout())
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                (client, since) = self._idle.pop()
+                self._count -= 1
+                self._close(client)
+        with self._dedicated_lock:
+            if self._dedicated is not None:
+                self._close(self._dedicated)
+                self._dedicated = None
+
+
+class _DedicatedClient(TclClient):
+    # All calls use the dedicated connection of a TclConnectionPool.
+    thread_safe = True
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def connection(self):
+        return self._pool.dedicated()
+
+    def call(self, string, *args):
+        with self._pool.dedicated() as client:
+            return client.call(string, *args)
+
+    def call_many(self, cmds, return_exceptions=False):
+        with self._pool.dedicated() as client:
+            return client.call_many(cmds, return_exceptions)
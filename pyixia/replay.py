@@ -0,0 +1,162 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import gzip
+import json
+import logging
+import time
+
+from .tclproto import TclClient, TclError, _check_results, _cmd_args
+from .tclproto import _parse_reply
+
+log = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+
+
+class ReplayError(Exception):
+    """The requests differ from the recorded ones."""
+
+
+def _encode_reply(reply):
+    # Replies are stored in the format of the socket protocol, so parsing
+    # them is part of the replay. Replies which cannot be represented, eg.
+    # results of a TclSSHClient with a CR, are stored as list.
+    if isinstance(reply, TclError):
+        if isinstance(reply.result, int):
+            return '%d1\r\n' % reply.result
+        return ['error', reply.result]
+    (result, io_output) = reply
+    if '\r' not in result and result.isascii() and (
+            io_output is None or io_output.isascii()):
+        return '%s%s0\r\n' % (io_output + '\r' if io_output else '', result)
+    return ['ok', result, io_output]
+
+
+def _decode_reply(raw):
+    if isinstance(raw, str):
+        return _parse_reply(raw.encode('ascii'))
+    if raw[0] == 'error':
+        return TclError(raw[1])
+    return (raw[1], raw[2])
+
+
+class RecordingClient(TclClient):
+    """Wraps a TCL client and records every request and its reply.
+
+    The trace is a gzip compressed file with one JSON document per line. The
+    first line is a header, every following line a list
+    `[start, duration, request, reply]`, where `start` is the time in seconds
+    since the client was connected and `duration` the time the request took.
+    """
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self._file = None
+        self._start = None
+
+    @property
+    def host(self):
+        return self.client.host
+
+    @property
+    def instrumentation(self):
+        return self.client.instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, instrumentation):
+        self.client.instrumentation = instrumentation
+
+    def _record(self, start, duration, request, reply):
+        record = [round(start - self._start, 6), round(duration, 6),
+                  request, _encode_reply(reply)]
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def call(self, string, *args):
+        start = time.monotonic()
+        try:
+            reply = self.client.call(string, *args)
+        except TclError as e:
+            reply = e
+        self._record(start, time.monotonic() - start, string % args, reply)
+        if isinstance(reply, TclError):
+            raise reply
+        return reply
+
+    def call_many(self, cmds, return_exceptions=False):
+        cmds = list(cmds)
+        start = time.monotonic()
+        results = self.client.call_many(cmds, return_exceptions=True)
+        # the replies of pipelined requests overlap, thus each gets an equal
+        # share of the total time
+        duration = (time.monotonic() - start) / max(len(cmds), 1)
+        for (cmd, reply) in zip(cmds, results):
+            (string, *args) = _cmd_args(cmd)
+            self._record(start, duration, string % tuple(args), reply)
+        return _check_results(results, return_exceptions)
+
+    def connect(self):
+        self.client.connect()
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self._start = time.monotonic()
+        header = dict(version=TRACE_VERSION, host=self.client.host,
+                      transport=self.client.__class__.__name__,
+                      time=time.time())
+        self._file.write(json.dumps(header) + '\n')
+
+    def close(self):
+        self.client.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ReplayClient(TclClient):
+    """Serves the replies of a trace of :class:`RecordingClient`.
+
+    The requests have to be issued in the same order as they were recorded,
+    otherwise a :class:`ReplayError` is raised. By default the replies are
+    returned immediately; with `timing`, every request takes as long as it
+    took when it was recorded.
+    """
+    def __init__(self, path, timing=False):
+        self.path = path
+        self.timing = timing
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            self.header = json.loads(f.readline())
+            if self.header.get('version') != TRACE_VERSION:
+                raise ReplayError('Unsupported trace version %s' %
+                                  self.header.get('version'))
+            self.records = [json.loads(line) for line in f]
+        self.host = self.header['host']
+        self._pos = None
+
+    def call(self, string, *args):
+        if self._pos is None:
+            raise RuntimeError('TclClient is not connected')
+        request = string % args
+        if self._pos >= len(self.records):
+            raise ReplayError('Trace exhausted at "%s"' % request)
+        (start, duration, recorded, raw) = self.records[self._pos]
+        if request != recorded:
+            raise ReplayError('Request #%d differs, expected "%s", got "%s"'
+                              % (self._pos + 1, recorded, request))
+        self._pos += 1
+        if self.timing:
+            time.sleep(duration)
+        reply = _decode_reply(raw)
+        if isinstance(reply, TclError):
+            raise reply
+        return reply
+
+    def connect(self):
+        log.debug('Replaying %d requests of %s', len(self.records), self.path)
+        self._pos = 0
+
+    def close(self):
+        if self._pos is not None and self._pos < len(self.records):
+            log.info('%d recorded requests were not replayed',
+                     len(self.records) - self._pos)
+        self._pos = None
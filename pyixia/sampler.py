@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import collections
+import logging
+import math
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+Sample = collections.namedtuple('Sample', 'timestamp monotonic values')
+Sample.__doc__ = """One sample of the statistic counters.
+
+`timestamp` is the wall clock time and `monotonic` the value of
+:func:`time.monotonic` when the counters were read. `values` is a dict which
+maps every port to a dict of counter values.
+"""
+
+
+class StatsSampler:
+    """Periodically reads statistic counters of a set of ports.
+
+    The counters (attribute names of :class:`pyixia.Statistics`, eg.
+    'frames_sent') of all ports are fetched in one round trip per sample. The
+    samples are taken on a fixed schedule, so there is no drift. If reading the
+    counters takes longer than the interval, the missed ticks are skipped and
+    counted in `missed`.
+    """
+    def __init__(self, api, ports, counters, interval=1.0, history=2,
+                 callback=None):
+        self._api = api
+        self.ports = list(ports)
+        self.counters = list(counters)
+        self.interval = interval
+        self.samples = collections.deque(maxlen=max(history, 2))
+        self.callback = callback
+        self.missed = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def poll(self):
+        """Reads all counters once and records the sample."""
+        requests = [(port.stats, type(port.stats).counter_members(
+                     self.counters)) for port in self.ports]
+        start = time.monotonic()
+        values = self._api.fetch(requests)
+        end = time.monotonic()
+
+        # the counters were sampled sometime during the round trip
+        delay = (end - start) / 2
+        values = dict((port, dict(zip(self.counters, v)))
+                      for (port, v) in zip(self.ports, values))
+        sample = Sample(time.time() - delay, end - delay, values)
+        self.samples.append(sample)
+        if self.callback is not None:
+            self.callback(sample)
+        return sample
+
+    def latest(self):
+        """Returns the most recent sample or None."""
+        if not self.samples:
+            return None
+        return self.samples[-1]
+
+    def deltas(self):
+        """Returns the counter differences between the last two samples.
+
+        A counter which has been decreased (eg. by resetting the statistics)
+        is assumed to be restarted at zero.
+        """
+        if len(self.samples) < 2:
+            return None
+        prev, cur = self.samples[-2], self.samples[-1]
+        deltas = dict()
+        for (port, values) in cur.values.items():
+            deltas[port] = dict()
+            for (counter, value) in values.items():
+                delta = value - prev.values[port][counter]
+                if delta < 0:
+                    delta = value
+                deltas[port][counter] = delta
+        return deltas
+
+    def rates(self):
+        """Returns the per second rates of the counters between the last two
+        samples, eg. frames per second for 'frames_sent' or bits per second
+        for 'bits_received'."""
+        deltas = self.deltas()
+        if deltas is None:
+            return None
+        elapsed = self.samples[-1].monotonic - self.samples[-2].monotonic
+        rates = dict()
+        for (port, values) in deltas.items():
+            rates[port] = dict((c, v / elapsed) for (c, v) in values.items())
+        return rates
+
+    def _run(self):
+        start = time.monotonic()
+        tick = 0
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                log.exception('Reading statistics failed')
+
+            tick += 1
+            now = time.monotonic()
+            due = math.ceil((now - start) / self.interval)
+            if due > tick:
+                log.info('Skipping %d samples', due - tick)
+                self.missed += due - tick
+                tick = due
+            self._stop.wait(start + tick * self.interval - now)
+
+    def start(self):
+        """Starts sampling in a background thread."""
+        if self._thread is not None:
+            raise RuntimeError('Sampler is already running')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='pyixia-stats-sampler')
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,728 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import argparse
+import collections
+import logging
+import queue
+import random
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+try:
+    import tkinter
+except ImportError:
+    tkinter = None
+
+log = logging.getLogger(__name__)
+
+CHASSIS_TYPE_XM12 = 22
+CARD_TYPE = 83
+CARD_TYPE_NAME = 'LM1000TXS4'
+PORT_TYPE = 8
+VERSION = '6.70.1050.15'
+
+# portGroup setCommand codes, see pyixia.PortGroup
+START_TRANSMIT = 7
+STOP_TRANSMIT = 8
+START_CAPTURE = 9
+STOP_CAPTURE = 10
+RESET_STATISTICS = 13
+TAKE_OWNERSHIP = 40
+TAKE_OWNERSHIP_FORCED = 41
+CLEAR_OWNERSHIP = 42
+CLEAR_OWNERSHIP_FORCED = 43
+
+# destination and source MAC and ethertype of the simulated frames
+FRAME_HEADER = bytes.fromhex('000000000001 000000000002 88b5')
+
+
+STREAM_DEFAULTS = dict(name='', enable='true', dma=0, numFrames=100,
+                       numBursts=1, loopCount=1, returnToId=1, rateMode=1,
+                       percentPacketRate=100.0, fpsRate=0.0, ifg=0.96,
+                       framesize=64, frameSizeType=0, frameSizeMIN=64,
+                       frameSizeMAX=1518, da='00 00 00 00 00 00',
+                       sa='00 00 00 00 00 00', numDA=1, numSA=1,
+                       daRepeatCounter=0, saRepeatCounter=0, patternType=0,
+                       dataPattern=0, pattern='00 01 02 03')
+
+
+class SimPort:
+    """One simulated port. While transmitting, the port sends `frame_rate`
+    frames per second to itself. While capturing, the received frames are
+    captured; their content is derived from their index, so the capture
+    takes no memory."""
+    READONLY = ('owner', 'type', 'linkState')
+    CAPTURE_READONLY = ('nPackets',)
+
+    def __init__(self, card, id, frame_rate=1000, frame_size=64):
+        self.card = card
+        self.id = id
+        self.frame_rate = frame_rate
+        self.frame_size = frame_size
+        self.attrs = dict(name='', owner='', type=PORT_TYPE, loopback=0,
+                          flowControl=0, linkState=1, portMode=0,
+                          transmitMode=0)
+        self.capture_attrs = dict(nPackets=0, captureMode=0, fullAction=0,
+                                  sliceSize=8191, sliceOffset=0)
+        self.streams = dict()
+        self.writes = 0
+        self._frames = 0
+        self._tx_start = None
+        self._captured = 0
+        self._capture_start = None
+
+    def start_transmit(self, now):
+        if self._tx_start is None:
+            self._tx_start = now
+
+    def stop_transmit(self, now):
+        self._frames = self.frames(now)
+        self._tx_start = None
+
+    def reset_statistics(self, now):
+        self._frames = 0
+        if self._tx_start is not None:
+            self._tx_start = now
+
+    def frames(self, now):
+        if self._tx_start is None:
+            return self._frames
+        return self._frames + int((now - self._tx_start) * self.frame_rate)
+
+    def start_capture(self, now):
+        self._captured = 0
+        self._capture_start = self.frames(now)
+
+    def stop_capture(self, now):
+        self._captured = self.captured(now)
+        self._capture_start = None
+
+    def captured(self, now):
+        if self._capture_start is None:
+            return self._captured
+        return self.frames(now) - self._capture_start
+
+    def captured_frame(self, index):
+        """Returns (timestamp, length, data) of the captured frame with the
+        one-based `index`."""
+        timestamp = index * 1000000000 // self.frame_rate
+        data = FRAME_HEADER + index.to_bytes(4, 'big')
+        data += bytes(max(self.frame_size - len(data), 0))
+        size = min(self.frame_size, self.capture_attrs['sliceSize'])
+        return (timestamp, self.frame_size, data[:size])
+
+    def counters(self, now):
+        frames = self.frames(now)
+        octets = frames * self.frame_size
+        return dict(bytesReceived=octets, bytesSent=octets,
+                    bitsReceived=octets * 8, bitsSent=octets * 8,
+                    framesReceived=frames, framesSent=frames,
+                    fcsErrors=0, framerFCSErrors=0, fragments=0)
+
+
+class SimCard:
+    READONLY = ('cardOperationMode', 'fpgaVersion', 'hwVersion', 'portCount',
+                'serialNumber', 'type', 'typeName')
+
+    def __init__(self, id, port_count, **port_args):
+        self.id = id
+        self.attrs = dict(cardOperationMode=0, clockRxRisingEdge=1,
+                          clockSelect=0, clockTxRisingEdge=1, fpgaVersion=1,
+                          hwVersion=1, portCount=port_count,
+                          serialNumber=1000 + id, txFrequencyDeviation=0,
+                          type=CARD_TYPE, typeName=CARD_TYPE_NAME)
+        self.ports = dict((n, SimPort(self, n, **port_args))
+                          for n in range(1, port_count + 1))
+
+
+class Simulator:
+    """In-memory model of an IXIA chassis which speaks the IxTclHal API.
+
+    Every connection gets its own Tcl interpreter (of :mod:`tkinter`), thus
+    scripts like the ones of :meth:`pyixia.ixapi.IxTclHalApi.batch` are
+    evaluated as on a real TclServer. The chassis, cards, ports and their
+    statistics are shared by all connections, port groups and the values of
+    the last get/config are per connection, like the temporary storage of the
+    IxTclHal commands.
+
+    `card_count` cards with `port_count` ports each are plugged into the
+    first slots. Every reply is delayed by `latency` seconds plus a uniformly
+    distributed `jitter` of up to +/- `jitter` seconds; requests which were
+    sent back-to-back are delayed concurrently, like on a network link.
+
+    `requests` counts the round trips and `commands` the IxTclHal commands,
+    eg. 'port get', which were executed.
+    """
+    def __init__(self, card_count=2, port_count=4, max_card_count=12,
+                 latency=0.0, jitter=0.0, seed=None, **port_args):
+        if tkinter is None:
+            raise RuntimeError('The simulator needs the tkinter module, '
+                               'eg. the python3-tk package')
+        self.latency = latency
+        self.jitter = jitter
+        self.chassis = dict(baseIpAddress='', cableLength=0,
+                            hostname='ixia-simulator', id=1,
+                            ipAddress='127.0.0.1', ixServerVersion=VERSION,
+                            master='', maxCardCount=max_card_count, name='',
+                            operatingSystem=4, sequence=1,
+                            type=CHASSIS_TYPE_XM12, typeName='Ixia XM12')
+        self.cards = dict((n, SimCard(n, port_count, **port_args))
+                          for n in range(1, card_count + 1))
+        self.requests = 0
+        self.commands = collections.Counter()
+        self.lock = threading.RLock()
+        self._random = random.Random(seed)
+
+    def get_port(self, card, port):
+        """Returns the :class:`SimPort` or None if there is no such port."""
+        card = self.cards.get(card)
+        if card is None:
+            return None
+        return card.ports.get(port)
+
+    def ports(self):
+        for card in self.cards.values():
+            yield from card.ports.values()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = 0
+            self.commands.clear()
+
+    def _delay(self):
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(-self.jitter, self.jitter)
+        return max(delay, 0.0)
+
+    def serve(self, host='127.0.0.1', port=0):
+        """Starts a TclServer in a background thread and returns the
+        :class:`SimulatorServer`. By default, a free port is used."""
+        server = SimulatorServer(self, (host, port))
+        server.start()
+        return server
+
+    def serve_stdio(self, rfile=None, wfile=None):
+        """Acts like a tclsh which reads its commands from `rfile` and writes
+        to `wfile`, ie. the peer of :class:`pyixia.tclproto.TclSSHClient`.
+        Returns at the end of the input."""
+        if rfile is None:
+            rfile = sys.stdin.buffer
+        if wfile is None:
+            wfile = sys.stdout.buffer
+        conn = _Connection(self, wfile)
+        for (arrival, script) in _requests(conn, rfile, b'\n'):
+            _wait(arrival + self._delay())
+            (rc, result, output) = conn.eval(script)
+            if rc != 0:
+                log.warning('Error in "%s": %s', script, result)
+
+    def ssh_transport(self):
+        """Returns a stand-in for the SSH connection of a
+        :class:`pyixia.tclproto.TclSSHClient`, which runs
+        :meth:`serve_stdio` in a thread for every channel::
+
+            client = TclSSHClient('ixia')
+            client._transport = simulator.ssh_transport()
+        """
+        return _StdioTransport(self)
+
+
+def _wait(due):
+    delay = due - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def _read_lines(rfile, lines):
+    try:
+        for line in rfile:
+            lines.put((time.monotonic(), line))
+    except (OSError, ValueError):
+        pass
+    finally:
+        lines.put(None)
+
+
+def _requests(conn, rfile, terminator):
+    """Yields (arrival time, script) tuples of the complete scripts read from
+    `rfile`. The lines are read by a separate thread, so the arrival time
+    isn't affected by the time it takes to answer preceding requests."""
+    lines = queue.Queue()
+    threading.Thread(target=_read_lines, args=(rfile, lines),
+                     daemon=True).start()
+    script = ''
+    while True:
+        item = lines.get()
+        if item is None:
+            return
+        (arrival, line) = item
+        if not line.endswith(terminator):
+            return
+        script += line[:-len(terminator)].decode('utf-8')
+        if not conn.complete(script):
+            script += '\n'
+            continue
+        yield (arrival, script)
+        script = ''
+
+
+class _Connection:
+    """One client of the simulator with its own Tcl interpreter. Output of
+    `puts` to stdout goes to `wfile` or is returned by :meth:`eval`."""
+    COMMANDS = ('chassis', 'card', 'port', 'stat', 'stream', 'capture',
+                'captureBuffer', 'portGroup', 'session', 'version',
+                'ixConnectToChassis', 'logOn', 'logOff')
+
+    def __init__(self, simulator, wfile=None):
+        self.sim = simulator
+        self.wfile = wfile
+        self.output = list()
+        self.hosts = set()
+        self.port_groups = dict()
+        self.user = ''
+        self.session_attrs = dict(captureBufferSegmentSize=0)
+        self.capture_buffer = None
+        self.values = collections.defaultdict(dict)
+        self._stat_values = dict()
+
+        self.tcl = tkinter.Tcl()
+        tk = self.tcl.tk
+        tk.eval('package provide IxTclHal %s' % VERSION)
+        tk.createcommand('__sim_call', self._call)
+        for name in self.COMMANDS:
+            tk.eval('proc %s args {'
+                    ' lassign [__sim_call %s {*}$args] code result;'
+                    ' return -code $code $result'
+                    '}' % (name, name))
+        for name in ('puts', 'flush', 'fconfigure', 'source'):
+            tk.eval('rename %s __sim_%s' % (name, name))
+            tk.createcommand(name, getattr(self, '_' + name))
+
+    def complete(self, script):
+        return self.tcl.tk.getboolean(
+                self.tcl.tk.call('info', 'complete', script))
+
+    def eval(self, script):
+        """Evaluates a script, returns (rc, result, io output)."""
+        with self.sim.lock:
+            self.sim.requests += 1
+        try:
+            (rc, result) = (0, self.tcl.tk.eval(script))
+        except tkinter.TclError as e:
+            (rc, result) = (1, str(e))
+        output = ''.join(self.output)
+        self.output.clear()
+        return (rc, result, output)
+
+    # Tcl core commands, which behave differently for stdout
+    def _write(self, text):
+        if self.wfile is None:
+            self.output.append(text)
+            return
+        # stdout is configured to UTF-8 by TclSSHClient
+        self.wfile.write(text.encode('utf-8'))
+
+    def _puts(self, *args):
+        newline = args[:1] != ('-nonewline',)
+        rest = args if newline else args[1:]
+        if len(rest) == 1:
+            rest = ('stdout',) + rest
+        if len(rest) != 2 or rest[0] != 'stdout':
+            return self.tcl.tk.call('__sim_puts', *args)
+        self._write(rest[1] + ('\n' if newline else ''))
+        return ''
+
+    def _flush(self, *args):
+        if args != ('stdout',):
+            return self.tcl.tk.call('__sim_flush', *args)
+        if self.wfile is not None:
+            self.wfile.flush()
+        return ''
+
+    def _fconfigure(self, *args):
+        if args[:1] != ('stdout',):
+            return self.tcl.tk.call('__sim_fconfigure', *args)
+        return ''
+
+    def _source(self, *args):
+        # there is no IxOS installation to load
+        if args and args[-1].endswith('IxiaWish.tcl'):
+            return ''
+        return self.tcl.tk.call('__sim_source', *args)
+
+    # IxTclHal commands
+    def _call(self, command, *args):
+        sub = args[0] if args else ''
+        with self.sim.lock:
+            self.sim.commands['%s %s' % (command, sub)] += 1
+            try:
+                result = getattr(self, '_ix_' + command)(*args)
+            except (KeyError, TypeError, ValueError, IndexError) as e:
+                log.debug('%s %s failed: %s', command, ' '.join(args), e)
+                return (1, '%s %s: %s' % (command, sub, e))
+        return (0, str(result))
+
+    def _cget(self, command, option):
+        values = self.values[command]
+        if not option.startswith('-') or option[1:] not in values:
+            raise ValueError('Invalid option %s' % option)
+        return values[option[1:]]
+
+    def _config(self, command, *args):
+        values = self.values[command]
+        if len(args) % 2:
+            raise ValueError('Missing value')
+        for (option, value) in zip(args[::2], args[1::2]):
+            values[option.lstrip('-')] = value
+        return ''
+
+    def _get(self, command, attrs):
+        if attrs is None:
+            return 1
+        self.values[command] = dict(attrs)
+        return 0
+
+    def _set(self, command, attrs, readonly=()):
+        if attrs is None:
+            return 1
+        for (key, value) in self.values[command].items():
+            if key in attrs and key not in readonly:
+                attrs[key] = value
+        return 0
+
+    def _generic(self, command, sub, args, attrs=None, readonly=()):
+        if sub == 'cget':
+            return self._cget(command, *args)
+        if sub == 'config':
+            return self._config(command, *args)
+        if sub == 'get':
+            return self._get(command, attrs)
+        if sub == 'set':
+            return self._set(command, attrs, readonly)
+        raise ValueError('Unknown subcommand %s' % sub)
+
+    def _ix_chassis(self, sub, *args):
+        if sub == 'add':
+            self.hosts.add(args[0])
+            return 0
+        if sub == 'del':
+            self.hosts.discard(args[0])
+            return 0
+        attrs = None
+        if sub in ('get', 'set') and args[0] in self.hosts:
+            attrs = self.sim.chassis
+        return self._generic('chassis', sub, args, attrs)
+
+    def _ix_card(self, sub, *args):
+        attrs = None
+        if sub in ('get', 'set', 'write'):
+            card = self.sim.cards.get(int(args[1]))
+            if card is not None:
+                attrs = card.attrs
+        if sub == 'write':
+            return 0 if attrs is not None else 1
+        return self._generic('card', sub, args, attrs, SimCard.READONLY)
+
+    def _ix_port(self, sub, *args):
+        if sub in ('cget', 'config'):
+            return self._generic('port', sub, args)
+        port = self.sim.get_port(int(args[1]), int(args[2]))
+        if port is None:
+            return 1
+        if sub == 'write':
+            port.writes += 1
+            return 0
+        if sub in ('setFactoryDefaults', 'setModeDefault'):
+            port.attrs.update(loopback=0, flowControl=0, portMode=0,
+                              transmitMode=0)
+            return 0
+        return self._generic('port', sub, args, port.attrs, SimPort.READONLY)
+
+    def _ix_stat(self, sub, *args):
+        if sub == 'get':
+            # the first argument selects the counters, all are returned
+            port = self.sim.get_port(int(args[2]), int(args[3]))
+            if port is None:
+                return 1
+            self.values['stat'] = port.counters(time.monotonic())
+            return 0
+        if sub == 'set':
+            return 0
+        return self._generic('stat', sub, args)
+
+    def _ix_stream(self, sub, *args):
+        if sub == 'setDefault':
+            self.values['stream'] = dict(STREAM_DEFAULTS)
+            return 0
+        if sub in ('cget', 'config'):
+            return self._generic('stream', sub, args)
+        port = self.sim.get_port(int(args[1]), int(args[2]))
+        if port is None:
+            return 1
+        stream = int(args[3])
+        if sub == 'set':
+            port.streams[stream] = dict(STREAM_DEFAULTS,
+                                        **self.values['stream'])
+            return 0
+        if sub == 'write':
+            return 0 if stream in port.streams else 1
+        return self._generic('stream', sub, args, port.streams.get(stream))
+
+    def _ix_capture(self, sub, *args):
+        if sub in ('cget', 'config'):
+            return self._generic('capture', sub, args)
+        port = self.sim.get_port(int(args[1]), int(args[2]))
+        if port is None:
+            return 1
+        port.capture_attrs['nPackets'] = port.captured(time.monotonic())
+        return self._generic('capture', sub, args, port.capture_attrs,
+                             SimPort.CAPTURE_READONLY)
+
+    def _ix_captureBuffer(self, sub, *args):
+        if sub == 'get':
+            port = self.sim.get_port(int(args[1]), int(args[2]))
+            (first, last) = (int(args[3]), int(args[4]))
+            if port is None or not 1 <= first <= last or \
+                    last > port.captured(time.monotonic()):
+                return 1
+            self.capture_buffer = (port, first)
+            self.values['captureBuffer'] = dict(numFrames=last - first + 1)
+            return 0
+        if sub == 'getframe':
+            (port, first) = self.capture_buffer
+            index = int(args[0])
+            values = self.values['captureBuffer']
+            if not 1 <= index <= values['numFrames']:
+                return 1
+            (timestamp, length, data) = port.captured_frame(first + index - 1)
+            values.update(timestamp=timestamp, length=length, status=0,
+                          fcs=0, frame=' '.join('%02X' % b for b in data))
+            return 0
+        return self._generic('captureBuffer', sub, args)
+
+    def _ix_portGroup(self, sub, *args):
+        if sub in ('cget', 'config', 'get', 'set'):
+            return self._generic('portGroup', sub, args)
+        group = args[0]
+        if sub == 'create':
+            if group in self.port_groups:
+                return 1
+            self.port_groups[group] = list()
+            return 0
+        if group not in self.port_groups:
+            return 1
+        if sub == 'destroy':
+            del self.port_groups[group]
+            return 0
+        if sub in ('add', 'del'):
+            port = self.sim.get_port(int(args[2]), int(args[3]))
+            if port is None:
+                return 1
+            if sub == 'add':
+                self.port_groups[group].append(port)
+            elif port in self.port_groups[group]:
+                self.port_groups[group].remove(port)
+            return 0
+        if sub == 'setCommand':
+            return self._set_command(self.port_groups[group], int(args[1]))
+        raise ValueError('Unknown subcommand %s' % sub)
+
+    def _set_command(self, ports, cmd):
+        now = time.monotonic()
+        self.values['portGroup']['lastTimeStamp'] = int(now * 1e9)
+        if cmd in (TAKE_OWNERSHIP, CLEAR_OWNERSHIP):
+            if any(p.attrs['owner'] not in ('', self.user) for p in ports):
+                return 1
+        for port in ports:
+            if cmd == START_TRANSMIT:
+                port.start_transmit(now)
+            elif cmd == STOP_TRANSMIT:
+                port.stop_transmit(now)
+            elif cmd == RESET_STATISTICS:
+                port.reset_statistics(now)
+            elif cmd == START_CAPTURE:
+                port.start_capture(now)
+            elif cmd == STOP_CAPTURE:
+                port.stop_capture(now)
+            elif cmd in (TAKE_OWNERSHIP, TAKE_OWNERSHIP_FORCED):
+                port.attrs['owner'] = self.user
+            elif cmd in (CLEAR_OWNERSHIP, CLEAR_OWNERSHIP_FORCED):
+                port.attrs['owner'] = ''
+        return 0
+
+    def _ix_session(self, sub, *args):
+        if sub == 'login':
+            self.user = args[0]
+            return 0
+        if sub == 'logout':
+            self.user = ''
+            return 0
+        self.session_attrs['userName'] = self.user
+        return self._generic('session', sub, args, self.session_attrs,
+                             ('userName',))
+
+    def _ix_version(self, sub, *args):
+        versions = dict(ixTclHALVersion=VERSION,
+                        productVersionNumber=VERSION, installVersion=VERSION)
+        # the versions can be read without a version get
+        self.values.setdefault('version', versions)
+        return self._generic('version', sub, args, versions)
+
+    def _ix_ixConnectToChassis(self, host):
+        self.hosts.add(host)
+        return 0
+
+    def _ix_logOn(self, *args):
+        return ''
+
+    def _ix_logOff(self, *args):
+        return ''
+
+
+class _SocketHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        sim = self.server.simulator
+        conn = _Connection(sim)
+        try:
+            self._serve(sim, conn)
+        finally:
+            # wakes up the reader thread, which blocks closing rfile
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _serve(self, sim, conn):
+        for (arrival, script) in _requests(conn, self.rfile, b'\r\n'):
+            (rc, result, output) = conn.eval(script)
+            if rc != 0:
+                log.debug('Error in "%s": %s', script, result)
+                # the message must not end the reply early
+                result = ' '.join(result.splitlines())
+            reply = '%s%s%d\r\n' % (output + '\r' if output else '',
+                                    result, rc)
+            _wait(arrival + sim._delay())
+            try:
+                self.wfile.write(reply.encode('utf-8'))
+            except OSError:
+                break
+
+
+class SimulatorServer(socketserver.ThreadingTCPServer):
+    """TclServer of a :class:`Simulator`, see :meth:`Simulator.serve`."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, simulator, address=('127.0.0.1', 4555)):
+        super().__init__(address, _SocketHandler)
+        self.simulator = simulator
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'socket://%s:%d' % self.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True,
+                                        name='pyixia-simulator')
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _StdioChannel:
+    """The part of a paramiko channel used by TclSSHClient."""
+    def __init__(self, simulator):
+        self.sim = simulator
+        (self._sock, self._peer) = socket.socketpair()
+
+    def exec_command(self, command):
+        rfile = self._peer.makefile('rb')
+        wfile = self._peer.makefile('wb')
+
+        def run():
+            try:
+                self.sim.serve_stdio(rfile, wfile)
+            finally:
+                self._peer.close()
+        threading.Thread(target=run, daemon=True).start()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class _StdioTransport:
+    def __init__(self, simulator):
+        self.sim = simulator
+
+    def acquire(self):
+        return self
+
+    def release(self):
+        pass
+
+    def open_session(self):
+        return _StdioChannel(self.sim)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Simulates an IXIA chassis and its TclServer.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on')
+    parser.add_argument('--port', type=int, default=4555,
+                        help='TCP port to listen on')
+    parser.add_argument('--stdio', action='store_true',
+                        help='act like a tclsh on stdin/stdout instead')
+    parser.add_argument('--cards', type=int, default=2,
+                        help='number of cards')
+    parser.add_argument('--ports', type=int, default=4,
+                        help='number of ports per card')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='delay of every reply in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='random variation of the delay in seconds')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='be more verbose')
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr)
+    if args.verbose:
+        logging.getLogger('pyixia.simulator').setLevel(logging.DEBUG)
+
+    simulator = Simulator(args.cards, args.ports, latency=args.latency,
+                          jitter=args.jitter)
+    if args.stdio:
+        simulator.serve_stdio()
+        return
+
+    server = SimulatorServer(simulator, (args.host, args.port))
+    print('Listening on %s' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
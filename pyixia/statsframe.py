@@ -0,0 +1,107 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ERROR_COUNTERS = ('fcs_errors', 'framer_fcs_errors', 'fragments')
+
+
+def _require_numpy():
+    if numpy is None:
+        raise RuntimeError('StatsFrame needs numpy, install pyixia[numpy]')
+
+
+class StatsFrame:
+    """Statistic counters of N ports and M counters as a NumPy array.
+
+    `values` is a C-contiguous int64 array of shape (N, M). The rows are
+    indexed by `port_ids`, an int array of shape (N, 3) with the
+    (chassis, card, port) tuples, the columns by the counter names in
+    `counters`, eg. 'frames_sent'.
+    """
+    def __init__(self, ports, counters, values, monotonic=None):
+        _require_numpy()
+        self.ports = list(ports)
+        self.counters = tuple(counters)
+        self.values = numpy.ascontiguousarray(values, dtype=numpy.int64)
+        self.port_ids = numpy.array([p._port_id() for p in self.ports],
+                                    dtype=numpy.int64).reshape(-1, 3)
+        self.monotonic = monotonic
+        self._rows = dict((p._port_id(), n) for (n, p) in enumerate(ports))
+
+    @classmethod
+    def fetch(cls, api, ports, counters):
+        """Reads the counters of all ports in a single round trip."""
+        _require_numpy()
+        ports = list(ports)
+        requests = [(port.stats, type(port.stats).counter_members(counters))
+                    for port in ports]
+        start = time.monotonic()
+        values = api.fetch(requests)
+        end = time.monotonic()
+        values = numpy.array(values, dtype=numpy.int64).reshape(
+                len(ports), len(counters))
+        return cls(ports, counters, values, (start + end) / 2)
+
+    def __len__(self):
+        return len(self.ports)
+
+    def __getitem__(self, counter):
+        return self.column(counter)
+
+    def column(self, counter):
+        """Returns the values of one counter for all ports."""
+        return self.values[:, self.counters.index(counter)]
+
+    def row(self, port):
+        """Returns the row index of a port, given as :class:`pyixia.Port` or
+        as (chassis, card, port) tuple."""
+        if hasattr(port, '_port_id'):
+            port = port._port_id()
+        return self._rows[tuple(port)]
+
+    def _check_compatible(self, other):
+        if (self.counters != other.counters or
+                not numpy.array_equal(self.port_ids, other.port_ids)):
+            raise ValueError('StatsFrames have different ports or counters')
+
+    def delta(self, prev):
+        """Returns the counter differences to an older frame. Counters which
+        have been decreased are assumed to be restarted at zero."""
+        self._check_compatible(prev)
+        delta = self.values - prev.values
+        return numpy.where(delta < 0, self.values, delta)
+
+    def rate(self, prev):
+        """Returns the per second rates (float64) since an older frame."""
+        return self.delta(prev) / (self.monotonic - prev.monotonic)
+
+    def loss(self, pairs=None):
+        """Returns the number of lost frames.
+
+        Without `pairs` the frames sent and received on the same port are
+        compared, eg. for looped ports. Otherwise `pairs` is a list of
+        (tx port, rx port) tuples and one value per pair is returned.
+        """
+        sent = self.column('frames_sent')
+        received = self.column('frames_received')
+        if pairs is None:
+            return sent - received
+        tx = numpy.fromiter((self.row(p[0]) for p in pairs), dtype=numpy.intp)
+        rx = numpy.fromiter((self.row(p[1]) for p in pairs), dtype=numpy.intp)
+        return sent[tx] - received[rx]
+
+    def errors(self, counters=None):
+        """Returns a boolean mask of the ports with any non zero error
+        counter. By default, all error counters of the frame are checked."""
+        if counters is None:
+            counters = [c for c in ERROR_COUNTERS if c in self.counters]
+        columns = [self.counters.index(c) for c in counters]
+        return (self.values[:, columns] != 0).any(axis=1)
@@ -7,10 +7,13 @@
 # Protocol parser for IXIA's underlying TclServer
 #
 
+import collections
 import socket
 import logging
-import paramiko
 import os.path
+import threading
+
+from .helper import tcl_quote
 
 log = logging.getLogger(__name__)
 
@@ -20,13 +23,17 @@ class TclError(Exception):
         self.result = result
 
     def __repr__(self):
-        return '%s(result=%d)' % (self.__class__.__name__, self.result)
+        return '%s(result=%r)' % (self.__class__.__name__, self.result)
 
     def __str__(self):
-        return '%s: %d' % (self.__class__.__name__, self.result)
+        return '%s: %s' % (self.__class__.__name__, self.result)
 
 
 class TclClient:
+    # set by IxTclHalApi.instrument(), gets the number of bytes of every
+    # request and reply
+    instrumentation = None
+
     def _tcl_hal_version(self):
         rsp = self.call('version cget -ixTclHALVersion')
         return rsp[0].split('.')
@@ -35,6 +42,144 @@ class TclClient:
         """Returns a tuple (major,minor) of the TCL HAL version."""
         return tuple(self._tcl_hal_version()[0:2])
 
+    def call_many(self, cmds, return_exceptions=False):
+        """Calls several commands and returns their results in order.
+
+        Each element of `cmds` is either a command string or a tuple of a
+        format string and its arguments, as they would be passed to `call`.
+
+        If `return_exceptions` is False, the first :class:`TclError` is raised
+        after all commands were processed. Otherwise, the exception is returned
+        in place of the result of the failing command.
+        """
+        results = list()
+        for cmd in cmds:
+            try:
+                results.append(self.call(*_cmd_args(cmd)))
+            except TclError as e:
+                results.append(e)
+        return _check_results(results, return_exceptions)
+
+
+def _tcl_error(result):
+    # IxTclHal procedures fail with a numeric code, the TCL interpreter itself
+    # with a message, eg. for an unknown command
+    try:
+        return TclError(int(result))
+    except ValueError:
+        return TclError(result)
+
+
+def _cmd_args(cmd):
+    if isinstance(cmd, str):
+        return (cmd,)
+    return tuple(cmd)
+
+
+def _check_results(results, return_exceptions):
+    if not return_exceptions:
+        for r in results:
+            if isinstance(r, TclError):
+                raise r
+    return results
+
+
+class RecvBuffer:
+    """Reassembles frames from a stream socket.
+
+    Data is received directly into a reusable bytearray, with `recv_into` if
+    the socket supports it. Frames are returned as `(start, end)` offsets into
+    `buf` without copying. They stay valid until the next read. The buffer
+    grows as needed, so frames may be arbitrarily large.
+    """
+    def __init__(self, fd, size=65536):
+        self.fd = fd
+        self.buf = bytearray(size)
+        self._start = 0
+        self._end = 0
+
+    def _fill(self):
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end == len(self.buf):
+            if self._start > 0:
+                # move the incomplete frame to the front
+                n = self._end - self._start
+                with memoryview(self.buf) as mv:
+                    mv[:n] = mv[self._start:self._end]
+                self._start, self._end = 0, n
+            else:
+                self.buf.extend(bytes(len(self.buf)))
+
+        if hasattr(self.fd, 'recv_into'):
+            with memoryview(self.buf) as mv:
+                n = self.fd.recv_into(mv[self._end:])
+        else:
+            data = self.fd.recv(len(self.buf) - self._end)
+            n = len(data)
+            self.buf[self._end:self._end+n] = data
+        if n == 0:
+            raise EOFError('Connection closed by peer')
+        self._end += n
+
+    def read_until(self, separator):
+        """Returns the offsets of the next frame including the separator."""
+        offset = 0
+        while True:
+            pos = self.buf.find(separator, self._start + offset, self._end)
+            if pos >= 0:
+                break
+            # the separator might be split between two receives
+            offset = max(self._end - self._start - len(separator) + 1, 0)
+            self._fill()
+        start = self._start
+        self._start = pos + len(separator)
+        return start, self._start
+
+    def read_exactly(self, size):
+        """Returns the offsets of the next `size` bytes."""
+        while self._end - self._start < size:
+            self._fill()
+        start = self._start
+        self._start += size
+        return start, self._start
+
+    def clear(self):
+        self._start = self._end = 0
+
+
+def _parse_reply(buf, start=0, end=None):
+    """Parses one reply of the socket protocol in `buf[start:end]`. Returns
+    a tuple (result, io_output) or a :class:`TclError`."""
+    # reply format is
+    #  [<io output>\r]<result><tcl return code>\r\n
+    # where tcl_return code is exactly one byte
+    if end is None:
+        end = len(buf)
+    if log.isEnabledFor(logging.DEBUG):
+        data = bytes(buf[start:end])
+        log.debug('received "%s" (%s)', data.rstrip(), data.hex())
+
+    if end - start < 3 or not 0x30 <= buf[end-3] <= 0x39:
+        raise RuntimeError('Malformed reply from TclServer')
+    tcl_result = buf[end-3] - 0x30
+
+    sep = buf.rfind(b'\r', start, end-3)
+    with memoryview(buf) as mv:
+        if sep >= 0:
+            io_output = str(mv[start:sep], 'utf-8') or None
+            result = str(mv[sep+1:end-3], 'utf-8')
+        else:
+            io_output = None
+            result = str(mv[start:end-3], 'utf-8')
+
+    if tcl_result == 1:
+        assert io_output == None
+        return _tcl_error(result)
+
+    log.debug('result=%s io_output=%s', result, io_output)
+    return result, io_output
+
 
 class TclSocketClient(TclClient):
     def __init__(self, host, port=4555):
@@ -42,58 +187,259 @@ class TclSocketClient(TclClient):
         self.port = port
         self.fd = None
         self.buffersize = 10240
+        self.window = 64
+        self.broken = False
+        self._rx = None
+
+    def _encode(self, string, *args):
+        # Errors in here don't affect the connection, nothing was sent yet.
+        string += '\r\n'
+        return (string % args).encode('utf-8')
+
+    def _send(self, data):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('sending "%s" (%s)',
+                      data.rstrip().decode('utf-8'), data.hex())
+        self.fd.sendall(data)
+        if self.instrumentation is not None:
+            self.instrumentation.io(len(data), 0)
+
+    def _recv(self):
+        (start, end) = self._rx.read_until(b'\r\n')
+        if self.instrumentation is not None:
+            self.instrumentation.io(0, end - start)
+        return _parse_reply(self._rx.buf, start, end)
+
+    def _break(self):
+        # The replies of requests which were already sent are unknown, they
+        # would be read by the next call. Thus, the connection can't be used
+        # any longer.
+        log.info('Closing broken connection to %s', self.host)
+        self.broken = True
+        try:
+            self.fd.close()
+        except OSError:
+            pass
+        self.fd = None
 
     def call(self, string, *args):
         if self.fd is None:
             raise RuntimeError('TclClient is not connected')
-
-        string += '\r\n'
-        data = string % args
-        log.debug('sending "%s" (%s)',
-                  data.rstrip(), data.encode('utf-8').hex())
-        self.fd.send(data)
-
-        # reply format is
-        #  [<io output>\r]<result><tcl return code>\r\n
-        # where tcl_return code is exactly one byte
-        data = self.fd.recv(self.buffersize)
-        log.debug('received "%s" (%s)', data.rstrip(), data.hex())
-        assert data[-2:] == b'\r\n'
-
-        tcl_result = int(data[-3])
-
-        data = data[:-3].rsplit('\r', 1)
-        if len(data) == 2:
-            io_output, result = data
-        else:
-            result = data[0]
-            io_output = None
-
-        result = result.decode('ascii')
-        if io_output:
-            io_output = io_output.decode('ascii')
-
-        if tcl_result == 1:
-            assert io_output == None
-            raise TclError(int(result))
-
-        log.debug('result=%s io_output=%s', result, io_output)
-        return result, io_output
+        data = self._encode(string, *args)
+        try:
+            self._send(data)
+            result = self._recv()
+        except BaseException:
+            self._break()
+            raise
+        if isinstance(result, TclError):
+            raise result
+        return result
+
+    def call_many(self, cmds, return_exceptions=False):
+        """Pipelined variant of :meth:`TclClient.call_many`.
+
+        The commands are written back-to-back without waiting for the
+        individual replies. At most `window` replies are outstanding at any
+        time, so neither side blocks on a full socket buffer.
+        """
+        if self.fd is None:
+            raise RuntimeError('TclClient is not connected')
+        requests = [self._encode(*_cmd_args(cmd)) for cmd in cmds]
+        results = list()
+        pending = 0
+        try:
+            for data in requests:
+                self._send(data)
+                pending += 1
+                if pending >= self.window:
+                    results.append(self._recv())
+                    pending -= 1
+            while pending:
+                results.append(self._recv())
+                pending -= 1
+        except BaseException:
+            self._break()
+            raise
+        return _check_results(results, return_exceptions)
 
     def connect(self):
         log.debug('Opening connection to %s:%d', self.host, self.port)
         fd = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         fd.connect((self.host, self.port))
         self.fd = fd
+        self.broken = False
+        self._rx = RecvBuffer(fd, self.buffersize)
         self.call('package req IxTclHal')
 
     def close(self):
         log.debug('Closing connection')
-        self.fd.close()
+        if self.fd is not None:
+            self.fd.close()
         self.fd = None
 
 
+class AsyncTclSocketClient:
+    """asyncio variant of :class:`TclSocketClient`.
+
+    :mod:`asyncio` is imported on first use, so synchronous users don't pay
+    for loading it.
+
+    Any number of commands may be outstanding at the same time. They are
+    written to the connection in the order `call` is invoked and the replies
+    are dispatched to the waiting callers by a reader task. If the reader
+    task stops, eg. because the connection was closed by the TclServer, all
+    outstanding and later calls fail with the same error.
+    """
+    def __init__(self, host, port=4555):
+        self.host = host
+        self.port = port
+        self.limit = 16 * 1024 * 1024
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = collections.deque()
+        self._error = None
+
+    async def _read_replies(self):
+        import asyncio
+        try:
+            while True:
+                data = await self._reader.readuntil(b'\r\n')
+                # a malformed reply fails the call it belongs to as well
+                result = _parse_reply(data)
+                future = self._pending.popleft()
+                if future.cancelled():
+                    continue
+                if isinstance(result, TclError):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError) as e:
+            self._error = EOFError('Connection closed by TclServer')
+            self._error.__cause__ = e
+        except Exception as e:
+            log.error('Reading replies failed: %s', e)
+            self._error = e
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(self._error)
+
+    async def call(self, string, *args):
+        import asyncio
+        if self._writer is None:
+            raise RuntimeError('TclClient is not connected')
+        if self._error is not None:
+            raise self._error
+
+        string += '\r\n'
+        data = string % args
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('sending "%s" (%s)',
+                      data.rstrip(), data.encode('utf-8').hex())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        self._writer.write(data.encode('utf-8'))
+        await self._writer.drain()
+        return await future
+
+    async def call_many(self, cmds, return_exceptions=False):
+        """Calls several commands concurrently and returns their results in
+        order. See :meth:`TclClient.call_many`."""
+        import asyncio
+        results = await asyncio.gather(
+                *[self.call(*_cmd_args(cmd)) for cmd in cmds],
+                return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception) and not isinstance(r, TclError):
+                raise r
+        return _check_results(results, return_exceptions)
+
+    async def hal_version(self):
+        """Returns a tuple (major,minor) of the TCL HAL version."""
+        rsp = await self.call('version cget -ixTclHALVersion')
+        return tuple(rsp[0].split('.')[0:2])
+
+    async def connect(self):
+        import asyncio
+        log.debug('Opening connection to %s:%d', self.host, self.port)
+        self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port, limit=self.limit)
+        self._error = None
+        self._reader_task = asyncio.ensure_future(self._read_replies())
+        await self.call('package req IxTclHal')
+
+    async def close(self):
+        log.debug('Closing connection')
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self._reader_task
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+
+
+class _SSHTransport:
+    """SSH connection which is shared by several :class:`TclSSHClient`
+    channels. It is opened by the first and closed by the last channel."""
+    def __init__(self, host, port, username, key_filename):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.key_filename = key_filename
+        self.ssh = None
+        self.users = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.ssh is None:
+                # paramiko takes a while to load, only SSH users pay for it
+                import paramiko
+                log.debug('Opening SSH connection to %s', self.host)
+                ssh = paramiko.SSHClient()
+                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                ssh.connect(self.host, port=self.port, username=self.username,
+                            key_filename=self.key_filename)
+                self.ssh = ssh
+            self.users += 1
+            return self.ssh.get_transport()
+
+    def release(self):
+        with self._lock:
+            self.users -= 1
+            if self.users == 0:
+                log.debug('Closing SSH connection to %s', self.host)
+                self.ssh.close()
+                self.ssh = None
+
+
 class TclSSHClient(TclClient):
+    """Runs a tclsh on the peer and talks to it over an SSH channel.
+
+    Several clients can share one SSH connection, see :meth:`channel`.
+    """
+    # We've spawned a non-interactive tclsh on the peer and we can control the
+    # output format ourselves. Every command is evaluated by the following
+    # procedure, which writes a frame
+    #   [<io output>]\0<sequence number> <tcl return code> <length>\n<result>
+    # where stdout is UTF-8 encoded and the result is exactly <length> bytes
+    # long. Thus the result may contain any character. The sequence number
+    # makes sure the start of the frame is not confused with the io output.
+    WRAPPER = (
+        'proc __pyixia_call {seq cmd} {'
+        ' set ret [catch {uplevel #0 $cmd} result];'
+        ' set length [string length [encoding convertto utf-8 $result]];'
+        ' puts -nonewline stdout "\\0$seq $ret $length\\n$result";'
+        ' flush stdout '
+        '}\n'
+    )
+
     def __init__(self, host, username="ixtcl", key_filename=None, port=22):
         self.host = host
         self.port = port
@@ -104,66 +450,100 @@ class TclSSHClient(TclClient):
                                              ".ssh", "id_ixia")
         self.fd = None
         self.buffersize = 10240
+        self.broken = False
+        self._rx = None
+        self._seq = 0
+        self._acquired = False
+        self._transport = _SSHTransport(self.host, self.port, self.username,
+                                        self.key_filename)
+
+    def channel(self):
+        """Returns a new, unconnected client which opens its own tclsh on the
+        SSH connection of this client instead of doing a new handshake."""
+        client = TclSSHClient(self.host, self.username, self.key_filename,
+                              self.port)
+        client._transport = self._transport
+        return client
 
     def call(self, string, *args):
         if self.fd is None:
             raise RuntimeError('TclClient is not connected')
 
         data = string % args
-        log.debug('sending "%s" (%s)',
-                  data.rstrip(), data.encode('utf-8').hex())
-
-        # We've spawned a non-interactive tclsh on the peer and we can control
-        # the output format ourselves. But keep it simple and use a similar
-        # format to the old socket protocol.
-        #  [<io output>]\r<result><tcl return code>\a
-        # where tcl_return code is exactly one byte
-        wrapper = '''\
-set ret [catch {%s} result];\
-puts -nonewline stdout "\\r${result}${ret}\\a";\
-flush stdout\r\n\
-'''
-        self.fd.send(wrapper % data)
-
-        data = b''
-        while not data.endswith(b'\a'):
-            data += self.fd.recv(self.buffersize)
-        log.debug('received "%s" (%s)', data.rstrip(), data.hex())
-
-        tcl_result = int(data[-2:-1])
-        io_output, result = data[:-2].rsplit(b'\r', 1)
-
-        if len(io_output) == 0:
-            io_output = None
-
-        result = result.decode('ascii')
-        if io_output:
-            io_output = io_output.decode('ascii')
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('sending "%s" (%s)',
+                      data.rstrip(), data.encode('utf-8').hex())
+
+        self._seq += 1
+        request = ('__pyixia_call %d %s\n' %
+                   (self._seq, tcl_quote(data))).encode('utf-8')
+        try:
+            (result, io_output, tcl_result, received) = self._transfer(
+                    request)
+        except BaseException:
+            self._break()
+            raise
+        if self.instrumentation is not None:
+            self.instrumentation.io(len(request), received)
 
         if tcl_result == 1:
-            assert io_output == None
-            raise TclError(int(result))
+            raise _tcl_error(result)
 
         log.debug('result=%s io_output=%s', result, io_output)
         return result, io_output
 
+    def _transfer(self, request):
+        self.fd.sendall(request)
+
+        marker = b'\0%d ' % self._seq
+        (start, end) = self._rx.read_until(marker)
+        received = end - start
+        with memoryview(self._rx.buf) as mv:
+            io_output = str(mv[start:end-len(marker)], 'utf-8') or None
+        (start, end) = self._rx.read_until(b'\n')
+        received += end - start
+        (tcl_result, length) = map(int, self._rx.buf[start:end].split())
+        (start, end) = self._rx.read_exactly(length)
+        with memoryview(self._rx.buf) as mv:
+            result = str(mv[start:end], 'utf-8')
+        return (result, io_output, tcl_result, received + length)
+
+    def _break(self):
+        # see TclSocketClient._break(), the SSH connection is released by
+        # close()
+        log.info('Closing broken SSH channel to %s', self.host)
+        self.broken = True
+        try:
+            self.fd.close()
+        except Exception:
+            pass
+        self.fd = None
+
     def connect(self):
-        log.debug('Opening SSH connection to %s', self.host)
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(self.host, username=self.username,
-                    key_filename=self.key_filename)
-        transport = ssh.get_transport()
-        chan = transport.open_session()
-        chan.exec_command("/bin/tclsh")
+        transport = self._transport.acquire()
+        try:
+            chan = transport.open_session()
+            chan.exec_command("/bin/tclsh")
+        except Exception:
+            self._transport.release()
+            raise
+        self._acquired = True
+        self.broken = False
         self.fd = chan
+        self._rx = RecvBuffer(chan, self.buffersize)
 
-        self.fd.send('fconfigure stdout -buffering full\n')
+        self.fd.sendall(b'fconfigure stdout -buffering full '
+                        b'-translation lf -encoding utf-8\n')
+        self.fd.sendall(self.WRAPPER.encode('utf-8'))
         self.call('source /opt/ixia/ixos/current/IxiaWish.tcl')
         self.call('package req IxTclHal')
         self.call('logOff')
 
     def close(self):
-        log.debug('Closing SSH connection')
-        self.fd.close()
+        log.debug('Closing SSH channel')
+        if self.fd is not None:
+            self.fd.close()
         self.fd = None
+        if self._acquired:
+            self._acquired = False
+            self._transport.release()
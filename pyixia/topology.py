@@ -0,0 +1,65 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import json
+import logging
+import os
+import re
+import tempfile
+
+log = logging.getLogger(__name__)
+
+
+def default_cache_dir():
+    cache = os.environ.get('XDG_CACHE_HOME',
+                           os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache, 'pyixia')
+
+
+class TopologyCache:
+    """On-disk cache of discovered chassis.
+
+    There is one JSON file per chassis host, which stores the description of
+    the cards and ports returned by :meth:`pyixia.Chassis.topology` together
+    with a key. The cached description is only used if the key, ie. the
+    IxServer and TCL HAL versions, still matches.
+    """
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = default_cache_dir()
+        self.directory = directory
+
+    def _path(self, host):
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', host)
+        return os.path.join(self.directory, '%s.json' % name)
+
+    def load(self, host, key):
+        """Returns the cached topology or None if there is no valid one."""
+        try:
+            with open(self._path(host)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('key') != key:
+            log.info('Topology cache of %s is outdated', host)
+            return None
+        return data['topology']
+
+    def save(self, host, key, topology):
+        os.makedirs(self.directory, exist_ok=True)
+        (fd, tmp) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(key=key, topology=topology), f)
+            os.replace(tmp, self._path(host))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def remove(self, host):
+        try:
+            os.unlink(self._path(host))
+        except FileNotFoundError:
+            pass
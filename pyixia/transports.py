@@ -0,0 +1,56 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import importlib
+import urllib.parse
+
+# Maps URL schemes to TCL client classes. A class may be given as
+# 'module:name' string, then the module is imported on first use. Thus,
+# eg. paramiko is only loaded if an ssh:// URL is used.
+_transports = {
+    'socket': 'pyixia.tclproto:TclSocketClient',
+    'ssh': 'pyixia.tclproto:TclSSHClient',
+    'replay': 'pyixia.replay:ReplayClient',
+}
+
+
+def register_transport(scheme, cls):
+    """Registers a TCL client class for an URL scheme.
+
+    `cls` is either the class or a 'module:name' string to import the class
+    lazily. The class is instantiated with the host (or the path, if the URL
+    has no host) and, if the URL contains a port, with a `port` keyword
+    argument.
+    """
+    _transports[scheme] = cls
+
+
+def get_transport(scheme):
+    """Returns the TCL client class of an URL scheme."""
+    try:
+        cls = _transports[scheme]
+    except KeyError:
+        raise RuntimeError('Unknown URL scheme "%s"' % scheme)
+    if isinstance(cls, str):
+        (module, name) = cls.split(':')
+        cls = getattr(importlib.import_module(module), name)
+        _transports[scheme] = cls
+    return cls
+
+
+def parse_url(url):
+    """Splits an URL into the scheme, the host and the keyword arguments
+    for the TCL client. URLs without a scheme are socket URLs."""
+    o = urllib.parse.urlparse(url, scheme='socket')
+    host = o.hostname or o.path
+    kwargs = dict(port=o.port) if o.port else dict()
+    return (o.scheme, host, kwargs)
+
+
+def client_from_url(url):
+    """Returns a new, unconnected TCL client for the given URL, eg.
+    'ssh://ixia' or '10.0.0.1'."""
+    (scheme, host, kwargs) = parse_url(url)
+    return get_transport(scheme)(host, **kwargs)
@@ -0,0 +1,54 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import io
+import struct
+
+from pyixia import Port
+from pyixia.capture import CaptureBuffer, Frame, PcapWriter, PcapngWriter
+from pyixia.ixapi import IxTclHalApi
+from nose.tools import eq_
+
+from test_ixapi import FakeTclHandler, FakeCard
+
+
+def test_capture_buffer_segments():
+    tcl = FakeTclHandler('5 2 100 64 0 0001 200 64 0 0203',
+                         '5 2 300 64 0 {} 400 64 0 04',
+                         '5 1 500 64 0 05')
+    api = IxTclHalApi(tcl)
+    port = Port(api, FakeCard(), 1)
+    frames = list(CaptureBuffer(api, port, segment_size=2).frames())
+    eq_(len(tcl.calls), 3)
+    eq_(tcl.calls[-1].split()[-5:], ['1', '1', '1', '5', '5'])
+    eq_([f.timestamp for f in frames], [100, 200, 300, 400, 500])
+    eq_(frames[1], Frame(200, 64, 0, b'\x02\x03'))
+    eq_(frames[2].data, b'')
+
+
+def test_pcap_writer():
+    f = io.BytesIO()
+    writer = PcapWriter(f)
+    writer.write(Frame(1500000000, 64, 0, b'\xaa' * 60))
+    data = f.getvalue()
+    eq_(struct.unpack('<IHH', data[:8]), (0xa1b23c4d, 2, 4))
+    eq_(struct.unpack('<IIII', data[24:40]), (1, 500000000, 60, 64))
+    eq_(len(data), 24 + 16 + 60)
+
+
+def test_pcapng_writer():
+    f = io.BytesIO()
+    writer = PcapngWriter(f)
+    writer.write(Frame(2 ** 32 + 1, 64, 0, b'\xaa' * 61))
+    data = f.getvalue()
+    blocks = list()
+    while data:
+        (type, length) = struct.unpack('<II', data[:8])
+        eq_(struct.unpack('<I', data[length-4:length])[0], length)
+        blocks.append((type, data[8:length-4]))
+        data = data[length:]
+    eq_([b[0] for b in blocks], [0x0a0d0d0a, 1, 6])
+    eq_(struct.unpack('<IIIII', blocks[2][1][:20]), (0, 1, 1, 61, 64))
+    eq_(len(blocks[2][1]), 20 + 64)
@@ -0,0 +1,144 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import csv
+import io
+import json
+from contextlib import redirect_stdout
+
+from pyixia import Ixia
+from pyixia.cli_tool import print_ports, print_stats, watch_stats
+from nose.tools import eq_
+
+from test_simulator import simulator
+
+
+def transmitting_ixia(server):
+    ixia = Ixia(server.url)
+    ixia.connect()
+    ixia.discover()
+    ixia.port_groups.get(ixia.get_ports(['1/1/1-2'])).start_transmit()
+    return ixia
+
+
+def record_samplers(ixia):
+    samplers = list()
+    new_stats_sampler = ixia.new_stats_sampler
+
+    def wrapper(*args, **kwargs):
+        samplers.append(new_stats_sampler(*args, **kwargs))
+        return samplers[-1]
+
+    ixia.new_stats_sampler = wrapper
+    return samplers
+
+
+def watch_cells(table):
+    """Returns a dict which maps the port to its (total, delta, rate)."""
+    cells = dict()
+    for line in table[3:]:
+        (port, values) = line.split('|')
+        cells[port.strip()] = tuple(values.split())
+    return cells
+
+
+def test_watch_table():
+    sim = simulator(card_count=1, port_count=2)
+    with sim.serve() as server:
+        ixia = transmitting_ixia(server)
+        samplers = record_samplers(ixia)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            watch_stats(ixia, ['1/1/1-2'], ['frames_sent'], 0.1, count=2)
+
+        lines = out.getvalue().splitlines()
+        eq_(len(lines), 2 * 5)
+        (first, second) = (lines[:5], lines[5:])
+        for table in (first, second):
+            assert 'interval 0.1s  missed' in table[0]
+            eq_(table[1].split(), ['Port', '|', 'frames_sent'])
+            eq_(table[2].split(), ['|', 'total', 'delta', 'rate/s'])
+
+        first = watch_cells(first)
+        second = watch_cells(second)
+        eq_(sorted(second), ['1/1/1', '1/1/2'])
+        for port in second:
+            eq_(first[port][1:], ('-', '-'))
+            (total, delta, rate) = second[port]
+            eq_(int(delta), int(total) - int(first[port][0]))
+            assert int(delta) > 0
+            assert rate != '-'
+
+        # the sampler is stopped after count samples
+        eq_(len(samplers), 1)
+        eq_(samplers[0]._thread, None)
+        eq_(len(samplers[0].samples), 2)
+        ixia.disconnect()
+
+
+def test_csv_output():
+    sim = simulator(card_count=1, port_count=2)
+    with sim.serve() as server:
+        ixia = transmitting_ixia(server)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            print_stats(ixia, ['1/1/1-2'], ['frames_sent', 'bytes_sent'],
+                        'csv')
+        lines = out.getvalue().splitlines()
+        eq_(lines[0], 'port,frames_sent,bytes_sent')
+        rows = list(csv.reader(lines[1:]))
+        eq_([r[0] for r in rows], ['1/1/1', '1/1/2'])
+        for (port, frames, size) in rows:
+            eq_(int(size), int(frames) * 64)
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            print_ports(ixia, 'csv')
+        eq_(out.getvalue().splitlines(),
+            ['port,link,owner', '1/1/1,up,', '1/1/2,up,'])
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            watch_stats(ixia, ['1/1/1'], ['frames_sent'], 0.1, 'csv',
+                        count=1)
+        lines = out.getvalue().splitlines()
+        eq_(lines[0], 'timestamp,port,frames_sent,frames_sent_rate')
+        eq_(next(csv.reader(lines[1:]))[1:2], ['1/1/1'])
+        eq_(len(lines), 2)
+        ixia.disconnect()
+
+
+def test_jsonl_output():
+    sim = simulator(card_count=1, port_count=2)
+    with sim.serve() as server:
+        ixia = transmitting_ixia(server)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            print_ports(ixia, 'jsonl')
+        eq_([json.loads(line) for line in out.getvalue().splitlines()],
+            [dict(port='1/1/1', link='up', owner=''),
+             dict(port='1/1/2', link='up', owner='')])
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            print_stats(ixia, ['1/1/1'], ['frames_sent'], 'jsonl')
+        row = json.loads(out.getvalue())
+        eq_(sorted(row), ['frames_sent', 'port'])
+        eq_(row['port'], '1/1/1')
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            watch_stats(ixia, ['1/1/1-2'], ['frames_sent'], 0.1, 'jsonl',
+                        count=2)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        eq_(len(rows), 4)
+        for row in rows:
+            eq_(sorted(row), ['frames_sent', 'frames_sent_rate', 'port',
+                              'timestamp'])
+        eq_([r['port'] for r in rows], ['1/1/1', '1/1/2'] * 2)
+        eq_([r['frames_sent_rate'] for r in rows[:2]], [None, None])
+        assert all(r['frames_sent_rate'] > 0 for r in rows[2:])
+        assert float(rows[0]['timestamp']) < float(rows[2]['timestamp'])
+        ixia.disconnect()
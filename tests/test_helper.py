@@ -0,0 +1,33 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+from pyixia.helper import tcl_list_split, tcl_quote
+from nose.tools import eq_
+
+
+def test_tcl_list_split():
+    eq_(tcl_list_split(''), [])
+    eq_(tcl_list_split('a'), ['a'])
+    eq_(tcl_list_split(' a  b\tc '), ['a', 'b', 'c'])
+    eq_(tcl_list_split('0 {} 1'), ['0', '', '1'])
+    eq_(tcl_list_split('{10/100 TXS} 4'), ['10/100 TXS', '4'])
+    eq_(tcl_list_split('{a {b c}} d'), ['a {b c}', 'd'])
+    eq_(tcl_list_split('"a b" c'), ['a b', 'c'])
+    eq_(tcl_list_split(r'a\ b \{ c\\'), ['a b', '{', 'c\\'])
+    eq_(tcl_list_split(r'\}\{'), ['}{'])
+
+
+def test_tcl_quote():
+    eq_(tcl_quote('a'), 'a')
+    eq_(tcl_quote(1), '1')
+    eq_(tcl_quote(''), '{}')
+    eq_(tcl_quote('a b'), r'a\ b')
+    eq_(tcl_quote('[exit]'), r'\[exit\]')
+    eq_(tcl_quote('a\nb'), r'a\nb')
+
+
+def test_tcl_quote_roundtrip():
+    for s in ('a b', '{', '}{', '"', '$x', 'a\\', 'x;y', '\r\n', ''):
+        eq_(tcl_list_split(tcl_quote(s)), [s])
@@ -0,0 +1,46 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+from pyixia import Port
+from pyixia.instrument import Histogram, _verb
+from pyixia.ixapi import IxTclHalApi
+from nose.tools import eq_
+
+from test_ixapi import FakeTclHandler, FakeCard
+
+
+def test_instrument_groups_by_caller():
+    tcl = FakeTclHandler('0', '1', '0', '0', '0', '1')
+    api = IxTclHalApi(tcl)
+    port = Port(api, FakeCard(), 1)
+    with api.instrument() as instrumentation:
+        port.link_state
+        port.name = 'foo'
+    port.link_state
+    report = instrumentation.report()
+    eq_(sorted(report), ['Port.link_state', 'Port.name='])
+    eq_(sorted(report['Port.link_state']), ['port cget', 'port get'])
+    eq_(report['Port.link_state']['port get']['count'], 1)
+    eq_(sorted(report['Port.name=']), ['port config', 'port set'])
+    eq_(api.instrumentation, None)
+    eq_(tcl.instrumentation, None)
+
+
+def test_verb():
+    eq_(_verb('port get 1 1 1'), 'port get')
+    eq_(_verb('list [port get 1 1 1] [port cget -name]'), 'fetch')
+    eq_(_verb('set __pyixia_r {}; foreach __pyixia_i 1 {}'), 'batch')
+    eq_(_verb('info tclversion'), 'info tclversion')
+    eq_(_verb('logOff'), 'logOff')
+
+
+def test_histogram():
+    h = Histogram()
+    for n in range(1, 101):
+        h.add(n * 1e-3)
+    eq_(h.count, 100)
+    assert 0.050 <= h.percentile(50) <= 0.050 * 1.19
+    assert 0.099 <= h.percentile(99) <= 0.100
+    eq_(h.percentile(100), 0.1)
@@ -3,10 +3,28 @@
 # Copyright (c) 2015 Kontron Europe GmbH
 #
 
+from pyixia import Port
 from pyixia.ixapi import translate_ix_member_name
+from pyixia.ixapi import IxTclHalApi, IxTclHalError
+from pyixia.ixapi import _MetaIxTclApi, TclMember, FLAG_RDONLY, CACHE_STATIC
 from nose.tools import eq_
 
 
+class FakeTclHandler:
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = list()
+
+    def call(self, cmd, *args):
+        self.calls.append(cmd % args)
+        return self.replies.pop(0), None
+
+
+class FakeCard:
+    def _card_id(self):
+        return (1, 1)
+
+
 def test_translate_ix_member_name():
     eq_(translate_ix_member_name('A'), 'a')
     eq_(translate_ix_member_name('AA'), 'aa')
@@ -36,3 +54,82 @@ def test_translate_ix_member_name():
     eq_(translate_ix_member_name('bAAb'), 'b_a_ab')
     eq_(translate_ix_member_name('framerFCSErrors'), 'framer_fcs_errors')
     eq_(translate_ix_member_name('ID'), 'id')
+
+
+def test_batch():
+    tcl = FakeTclHandler('0 0 0 {a b}')
+    api = IxTclHalApi(tcl)
+    with api.batch():
+        api.call_rc('port set %d %d %d', 1, 2, 3)
+        r = api.call('port cget -name')
+    eq_(len(tcl.calls), 1)
+    eq_(r[0], 'a b')
+
+
+def test_batch_error():
+    tcl = FakeTclHandler('0 0 0 202')
+    api = IxTclHalApi(tcl)
+    try:
+        with api.batch() as b:
+            api.call_rc('portGroup add 1 1 1 1')
+            api.call_rc('portGroup add 1 1 1 2')
+            api.call_rc('portGroup add 1 1 1 3')
+    except IxTclHalError as e:
+        eq_(e.rc, 202)
+        eq_(e.cmd, 'portGroup add 1 1 1 2')
+    else:
+        assert False
+    eq_(b.results[0].result(), ('0', None))
+
+
+class Dummy(metaclass=_MetaIxTclApi):
+    __tcl_command__ = 'dummy'
+    __tcl_members__ = [
+            TclMember('typeName', flags=FLAG_RDONLY, cache=CACHE_STATIC),
+            TclMember('linkState', type=int, flags=FLAG_RDONLY),
+    ]
+
+    def __init__(self, api):
+        self._api = api
+
+    def _ix_get_cmd(self, member):
+        return 'dummy get'
+
+    def _ix_get(self, member):
+        self._api.call_rc(self._ix_get_cmd(member))
+
+
+def test_cache():
+    tcl = FakeTclHandler('0', 'foo', '0', '1', '0', '0', '0 {foo bar} 1',
+                         '0 baz')
+    d = Dummy(IxTclHalApi(tcl))
+    eq_(d.type_name, 'foo')
+    eq_(d.type_name, 'foo')
+    eq_(d.link_state, 1)
+    eq_(d.link_state, 0)
+    eq_(len(tcl.calls), 6)
+    eq_(d.snapshot(), Dummy.Snapshot('foo bar', 1))
+    eq_(d.type_name, 'foo bar')
+    d.invalidate('type_name')
+    d.refresh()
+    eq_(d.type_name, 'baz')
+    eq_(len(tcl.calls), 8)
+
+
+def test_configure():
+    tcl = FakeTclHandler('0 0 3', '0 0 0 {} 0 0 0 {}', '0 3')
+    port = Port(IxTclHalApi(tcl), FakeCard(), 2)
+    with port.configure(write=True):
+        port.loopback = 1
+        port.port_mode = 3
+        eq_(port.loopback, '1')
+    eq_(len(tcl.calls), 2)
+    assert tcl.calls[1].startswith('set __pyixia_r')
+    assert 'loopback' in tcl.calls[1]
+    assert 'portMode' not in tcl.calls[1]
+    assert 'port\\ write\\ 1\\ 1\\ 2' in tcl.calls[1]
+
+    # nothing changed, only the current value is read
+    with port.configure():
+        port.port_mode = 3
+    eq_(len(tcl.calls), 3)
@@ -0,0 +1,92 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+from pyixia.pool import TclConnectionPool
+from nose.tools import eq_
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = list()
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+
+    def close(self):
+        self.connected = False
+
+    def call(self, cmd, *args):
+        if cmd == 'fail':
+            raise EOFError()
+        self.calls.append(cmd % args)
+        return '0', None
+
+
+def test_pool_connection_is_bound_to_context():
+    clients = list()
+
+    def factory():
+        clients.append(FakeClient())
+        return clients[-1]
+
+    pool = TclConnectionPool(factory, size=2)
+    pool.connect()
+    with pool.connection() as c1:
+        pool.call('port config -loopback 1')
+        with pool.connection() as c2:
+            eq_(c1, c2)
+            pool.call('port set 1 1 1')
+        other = pool.checkout()
+        assert other is not c1
+        pool.checkin(other)
+    eq_(len(clients), 2)
+    eq_(c1.calls, ['port config -loopback 1', 'port set 1 1 1'])
+
+    try:
+        pool.call('fail')
+    except EOFError:
+        pass
+    eq_(pool._count, 1)
+
+    pool.close()
+    eq_([c.connected for c in clients], [False, False])
+
+
+def test_pool_dedicated_connection():
+    clients = list()
+    setups = list()
+
+    def factory():
+        clients.append(FakeClient())
+        return clients[-1]
+
+    pool = TclConnectionPool(factory, size=1, setup=setups.append,
+                             timeout=0.1)
+    pool.connect()
+    busy = pool.checkout()
+    try:
+        pool.checkout()
+    except TimeoutError:
+        pass
+    else:
+        assert False
+
+    # the dedicated connection doesn't count against the size
+    pool.dedicated_client().call('portGroup create 1')
+    with pool.dedicated() as c1:
+        pass
+    eq_(c1.calls, ['portGroup create 1'])
+    eq_(len(clients), 2)
+
+    # it is set up again instead of being replaced
+    pool.invalidate()
+    with pool.dedicated() as c2:
+        eq_(c1, c2)
+    eq_(setups, [busy, c1, c1])
+
+    pool.checkin(busy)
+    pool.close()
+    eq_([c.connected for c in clients], [False, False])
@@ -0,0 +1,144 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from pyixia import Chassis, Ixia, PortGroup, Statistics, expand_port_ids
+from pyixia.ixapi import IxTclHalApi
+from pyixia.topology import TopologyCache
+from nose.tools import eq_
+
+from test_ixapi import FakeTclHandler
+
+
+DISCOVER_REPLY = ('{Ixia 400T} 4 {{1 42 {LM1000 TXS4} 2 '
+                  '{{1 8} {2 8}}} {3 43 X 1 {{1 9}}}}')
+
+
+def discovered_chassis(*replies):
+    tcl = FakeTclHandler(DISCOVER_REPLY, *replies)
+    chassis = Chassis(IxTclHalApi(tcl), 'ixia')
+    chassis._ix_cache_update(id=1)
+    chassis.discover()
+    return (chassis, tcl)
+
+
+def test_discover_server_side():
+    (chassis, tcl) = discovered_chassis()
+    eq_(len(tcl.calls), 1)
+    eq_([str(c) for c in chassis.cards], ['1/1', '1/3'])
+    card = chassis.cards[0]
+    eq_(card.type_name, 'LM1000 TXS4')
+    eq_(card.port_count, 2)
+    eq_([str(p) for p in card.ports], ['1/1/1', '1/1/2'])
+    eq_(card.ports[1].type, 8)
+    eq_(chassis.max_card_count, 4)
+    eq_(len(tcl.calls), 1)
+
+
+def test_expand_port_ids():
+    eq_(list(expand_port_ids(['1/2/3', (1, 1, 1)])), [(1, 2, 3), (1, 1, 1)])
+    eq_(list(expand_port_ids(['1/1-2/3-4'])),
+        [(1, 1, 3), (1, 1, 4), (1, 2, 3), (1, 2, 4)])
+    for pid in ('1/1/16-1', '1/1/', 'a/1/1', '1/1', '1/1/1/1', '1/1/1-x'):
+        try:
+            list(expand_port_ids([pid]))
+        except ValueError as e:
+            eq_(str(e), 'Invalid port ID "%s"' % pid)
+        else:
+            assert False, pid
+
+
+def test_get_ports():
+    (chassis, tcl) = discovered_chassis('0 {} {} 0 {} owner 0 p {}')
+    i = Ixia('ixia')
+    i.chassis = chassis
+    i._api = chassis._api
+    eq_(str(i.get_port('1/3/1')), '1/3/1')
+    eq_(str(i.get_port((1, 1, 2))), '1/1/2')
+    eq_([str(p) for p in i.get_ports(['1/1/1-2', '1/3/1'])],
+        ['1/1/1', '1/1/2', '1/3/1'])
+    for (pid, error) in (('1/2/1', LookupError), ('1/1/1-2', ValueError)):
+        try:
+            i.get_port(pid)
+        except error:
+            pass
+        else:
+            assert False
+    eq_([str(p) for p in i.find_ports(owner='owner')], ['1/1/2'])
+    eq_(len(tcl.calls), 2)
+
+
+def test_write_streams():
+    (chassis, tcl) = discovered_chassis('0')
+    port = chassis.cards[0].ports[1]
+    streams = port.write_streams([dict(name='a b', framesize=64),
+                                  dict()], first_id=3)
+    eq_([str(s) for s in streams], ['1/1/2/3', '1/1/2/4'])
+    eq_(len(tcl.calls), 2)
+    assert tcl.calls[1].endswith(
+        '__pyixia_streams 1 1 2 3 {{-name a\\ b -framesize 64} {}}')
+    try:
+        port.write_streams([dict(frame_size=64)])
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_counter_members():
+    eq_([m.name for m in Statistics.counter_members(['frames_sent'])],
+        ['framesSent'])
+    try:
+        Statistics.counter_members(['frames_sent', 'bogus'])
+    except ValueError as e:
+        eq_(str(e), "Unknown counter 'bogus'")
+    else:
+        assert False
+
+
+def test_port_group_ids():
+    api = IxTclHalApi(FakeTclHandler())
+    ids = [PortGroup(api).id for n in range(3)]
+    eq_(ids[1:], [ids[0] + 1, ids[0] + 2])
+    eq_(PortGroup(api, id=42).id, 42)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ids = list(executor.map(lambda n: PortGroup(api).id, range(1000)))
+    eq_(len(set(ids)), 1000)
+
+
+def test_port_group_set_ports():
+    (chassis, tcl) = discovered_chassis('0 0 0 0', '0 0 0 0 0 0')
+    (p1, p2) = chassis.cards[0].ports
+    p3 = chassis.cards[1].ports[0]
+    pg = PortGroup(chassis._api, id=7)
+    pg.add_ports([p1, p2])
+    pg.set_ports([p2, p3])
+    eq_(len(tcl.calls), 3)
+    assert r'portGroup\ del\ 7\ 1\ 1\ 1' in tcl.calls[2]
+    assert r'portGroup\ add\ 7\ 1\ 3\ 1' in tcl.calls[2]
+    eq_(pg.ports, [p2, p3])
+
+
+def test_topology_cache():
+    (chassis, tcl) = discovered_chassis()
+    key = dict(ix_server_version='9.10')
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = TopologyCache(tmp)
+        cache.save('ixia', key, chassis.topology())
+        eq_(cache.load('ixia', dict(ix_server_version='9.20')), None)
+        topology = cache.load('ixia', key)
+
+    tcl = FakeTclHandler()
+    other = Chassis(IxTclHalApi(tcl), 'ixia')
+    other._ix_cache_update(id=1)
+    other.build(topology)
+    eq_([str(p) for c in other.cards for p in c.ports],
+        ['1/1/1', '1/1/2', '1/3/1'])
+    eq_(other.cards[0].type_name, 'LM1000 TXS4')
+    eq_(other.cards[0].ports[1].type, 8)
+    eq_(len(tcl.calls), 0)
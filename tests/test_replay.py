@@ -0,0 +1,71 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import os
+import tempfile
+import time
+
+from pyixia import Ixia
+from pyixia.replay import ReplayError, _decode_reply, _encode_reply
+from pyixia.tclproto import TclError
+from nose.tools import eq_
+
+from test_simulator import simulator
+
+
+def test_encode_reply():
+    for reply in (('0', None), ('a b', 'output'), ('a\rb', None),
+                  ('\xe4', None)):
+        eq_(_decode_reply(_encode_reply(reply)), reply)
+    eq_(_encode_reply(('0', None)), '00\r\n')
+    eq_(_decode_reply(_encode_reply(TclError(1))).result, 1)
+    eq_(_decode_reply(_encode_reply(TclError('failed'))).result, 'failed')
+
+
+def session(ixia):
+    ixia.connect()
+    ixia.discover()
+    port = ixia.get_port('1/1/2')
+    port.name = 'recorded'
+    result = (port.name, port.link_state,
+              ixia.fetch_stats([port], ['frames_sent'])[port])
+    ixia.disconnect()
+    return result
+
+
+def test_record_and_replay():
+    sim = simulator()
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = os.path.join(tmp, 'trace.gz')
+        with sim.serve() as server:
+            recorded = session(Ixia(server.url, record=trace))
+
+        eq_(session(Ixia(server.url, replay=trace)), recorded)
+
+        ixia = Ixia(server.url, replay=trace)
+        ixia.connect()
+        try:
+            ixia.session.login('other')
+        except ReplayError:
+            pass
+        else:
+            assert False
+
+
+def test_replay_timing():
+    sim = simulator(latency=0.02)
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = os.path.join(tmp, 'trace.gz')
+        with sim.serve() as server:
+            session(Ixia(server.url, record=trace))
+
+        for timing in (False, True):
+            start = time.monotonic()
+            session(Ixia(server.url, replay=trace, replay_timing=timing))
+            elapsed = time.monotonic() - start
+            if timing:
+                assert elapsed >= 0.1, elapsed
+            else:
+                assert elapsed < 0.1, elapsed
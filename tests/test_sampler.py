@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import threading
+import time
+
+from pyixia import Ixia, Port, StatsSampler
+from pyixia.ixapi import IxTclHalApi
+from nose.tools import eq_
+
+from test_ixapi import FakeTclHandler, FakeCard
+from test_simulator import simulator
+
+
+def test_sampler_deltas():
+    tcl = FakeTclHandler('0 100 0 800', '0 150 0 1200', '0 10 0 80')
+    api = IxTclHalApi(tcl)
+    port = Port(api, FakeCard(), 1)
+    s = StatsSampler(api, [port], ['frames_sent', 'bits_sent'])
+    eq_(s.deltas(), None)
+    s.poll()
+    s.poll()
+    eq_(len(tcl.calls), 2)
+    eq_(s.deltas(), {port: {'frames_sent': 50, 'bits_sent': 400}})
+    rates = s.rates()[port]
+    eq_(round(rates['bits_sent'] / rates['frames_sent']), 8)
+
+    # statistics were reset
+    s.poll()
+    eq_(s.deltas(), {port: {'frames_sent': 10, 'bits_sent': 80}})
+
+
+def test_sampler_schedule():
+    sim = simulator(card_count=1, port_count=1)
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        ixia.discover()
+
+        # remember when every read starts
+        starts = list()
+        fetch = ixia._api.fetch
+
+        def timed_fetch(requests):
+            starts.append(time.monotonic())
+            return fetch(requests)
+        ixia._api.fetch = timed_fetch
+
+        # the third read takes longer than two intervals
+        done = threading.Event()
+
+        def callback(sample):
+            n = len(starts)
+            sim.latency = 0.25 if n == 2 else 0.0
+            if n == 6:
+                done.set()
+
+        interval = 0.1
+        sampler = ixia.new_stats_sampler(ixia.get_ports(['1/1/1']),
+                                         ['frames_sent'], interval,
+                                         callback=callback)
+        with sampler:
+            assert done.wait(5)
+        ixia.disconnect()
+
+    ticks = [(s - starts[0]) / interval for s in starts[:6]]
+    for tick in ticks:
+        assert abs(tick - round(tick)) < 0.3, ticks
+    eq_([round(t) for t in ticks], [0, 1, 2, 5, 6, 7])
+    eq_(sampler.missed, 2)
@@ -0,0 +1,547 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+import types
+from unittest import SkipTest
+
+from pyixia import Ixia, MultiIxia, Port
+from pyixia.ixapi import AsyncIxTclHalApi, IxTclHalError
+from pyixia.simulator import Simulator, tkinter
+from pyixia.tclproto import AsyncTclSocketClient, TclError, TclSSHClient
+from nose.tools import eq_
+
+
+def simulator(**kwargs):
+    # Without tkinter, the simulator raises an error, unless the tests which
+    # need it are skipped explicitly.
+    if tkinter is None and os.environ.get('PYIXIA_SKIP_SIMULATOR'):
+        raise SkipTest('tkinter is not installed')
+    return Simulator(**kwargs)
+
+
+def test_discover_and_stats():
+    sim = simulator(card_count=3, port_count=2)
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        sim.reset_counters()
+        ixia.discover()
+        eq_(sim.requests, 1)
+        eq_([str(p) for p in ixia.get_ports(['1/1-3/1-2'])],
+            ['1/1/1', '1/1/2', '1/2/1', '1/2/2', '1/3/1', '1/3/2'])
+        eq_(ixia.chassis.cards[0].port_count, 2)
+
+        ixia.session.login('tester')
+        ports = ixia.get_ports(['1/1/1-2'])
+        pg = ixia.new_port_group()
+        pg.create()
+        for port in ports:
+            pg.add_port(port)
+        pg.take_ownership()
+        eq_(ports[0].owner, 'tester')
+        pg.start_transmit()
+        time.sleep(0.05)
+        pg.stop_transmit()
+
+        sim.reset_counters()
+        stats = ixia.fetch_stats(ports, ['frames_sent', 'bytes_sent'])
+        eq_(sim.requests, 1)
+        sent = stats[ports[0]]['frames_sent']
+        assert sent > 0
+        eq_(stats[ports[0]]['bytes_sent'], sent * 64)
+        ixia.disconnect()
+
+
+def test_configure():
+    sim = simulator()
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        ixia.discover()
+        port = ixia.get_port('1/2/3')
+        port.name = 'uplink 1'
+        eq_(sim.get_port(2, 3).attrs['name'], 'uplink 1')
+        sim.reset_counters()
+        with port.configure(write=True) as p:
+            p.loopback = 1
+        eq_(sim.requests, 2)
+        eq_(sim.get_port(2, 3).attrs['loopback'], '1')
+        eq_(sim.get_port(2, 3).writes, 1)
+
+        # values are not interpreted as format strings
+        port.name = '50% load'
+        eq_(sim.get_port(2, 3).attrs['name'], '50% load')
+        with port.configure() as p:
+            p.name = '100%s load'
+        eq_(sim.get_port(2, 3).attrs['name'], '100%s load')
+        port.invalidate('name')
+        eq_(port.name, '100%s load')
+
+
+def test_discover_falls_back_on_tcl_error():
+    sim = simulator(card_count=2, port_count=2, max_card_count=4)
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        # without procs, the server side discovery fails with a message
+        ixia._tcl.call('rename proc {}')
+        try:
+            ixia._tcl.call('proc foo {} {}')
+        except TclError as e:
+            eq_(e.result, 'invalid command name "proc"')
+        else:
+            assert False
+        ixia.discover()
+        eq_([str(c) for c in ixia.chassis.cards], ['1/1', '1/2'])
+        eq_(len(ixia.chassis.cards[1].ports), 2)
+
+
+def test_multi_ixia():
+    sims = [simulator(card_count=1, port_count=2, latency=0.05),
+            simulator(card_count=2, port_count=1, latency=0.05)]
+    with sims[0].serve() as s1, sims[1].serve() as s2:
+        multi = MultiIxia([s1.url, s2.url])
+        multi.disconnect()
+        multi.connect()
+        multi.discover()
+        eq_([c.id for c in multi.chassis], [1, 2])
+        ports = multi.get_ports(['1/1/1-2', '2/1-2/1'])
+        eq_([str(p) for p in ports], ['1/1/1', '1/1/2', '2/1/1', '2/2/1'])
+        eq_(str(multi.get_port('2/2/1')), '2/2/1')
+        try:
+            multi.get_port('3/1/1')
+        except LookupError:
+            pass
+        else:
+            assert False
+
+        multi.login('tester')
+        pg = multi.new_port_group(ports)
+        eq_(len(pg.groups), 2)
+        pg.create()
+        pg.take_ownership()
+        eq_([sims[0].get_port(1, n).attrs['owner'] for n in (1, 2)],
+            ['tester', 'tester'])
+        eq_(sims[1].get_port(2, 1).attrs['owner'], 'tester')
+
+        # both chassis are asked concurrently
+        start = time.monotonic()
+        pg.start_transmit()
+        assert time.monotonic() - start < 0.09
+        time.sleep(0.05)
+        pg.stop_transmit()
+        stats = multi.fetch_stats(ports, ['frames_sent'])
+        eq_(set(stats), set(ports))
+        assert all(s['frames_sent'] > 0 for s in stats.values())
+        pg.destroy()
+
+        multi.disconnect()
+        multi.disconnect()
+
+
+def test_pool_threads_share_session():
+    sim = simulator(card_count=2, port_count=4, latency=0.002)
+    with sim.serve() as server:
+        ixia = Ixia(server.url, pool_size=4)
+        ixia.connect()
+        ixia.discover()
+        ixia.session.login('me')
+        errors = list()
+        barrier = threading.Barrier(4)
+
+        def worker(ports):
+            try:
+                barrier.wait()
+                for n in range(3):
+                    pg = ixia.new_port_group()
+                    pg.create()
+                    for port in ports:
+                        pg.add_port(port)
+                    pg.take_ownership()
+                    pg.destroy()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(
+                   ixia.get_ports(['1/%d/1-4' % (n % 2 + 1)]),))
+                   for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq_(errors, [])
+        eq_(set(p.attrs['owner'] for p in sim.ports()), set(['me']))
+
+        ports = ixia.get_ports(['1/1/1-2'])
+        pg = ixia.port_groups.get(ports)
+        pg.clear_ownership()
+        eq_(ports[0].owner, '')
+        ixia.disconnect()
+
+
+def test_pool_port_groups_use_dedicated_connection():
+    sim = simulator(card_count=1, port_count=2)
+    with sim.serve() as server:
+        ixia = Ixia(server.url, pool_size=1)
+        ixia.connect()
+        ixia.discover()
+        ixia.session.login('me')
+        ports = ixia.get_ports(['1/1/1-2'])
+        pg = ixia.port_groups.get(ports)
+        pg.take_ownership()
+        eq_(ports[0].owner, 'me')
+
+        # the live group uses the new login, too
+        ixia.session.logout()
+        ixia.session.login('other')
+        try:
+            pg.take_ownership()
+        except IxTclHalError:
+            pass
+        else:
+            assert False
+        pg.clear_ownership(force=True)
+        pg.take_ownership()
+        eq_(sim.get_port(1, 1).attrs['owner'], 'other')
+        ixia.disconnect()
+
+
+def test_latency_is_pipelined():
+    sim = simulator(latency=0.05)
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        start = time.monotonic()
+        ixia._tcl.call_many(['info tclversion'] * 20)
+        elapsed = time.monotonic() - start
+        assert 0.05 <= elapsed < 0.5, elapsed
+
+
+def test_capture_download():
+    sim = simulator(card_count=1, port_count=1, frame_rate=10000)
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        ixia.discover()
+        ixia.session.login('tester')
+        port = ixia.get_port('1/1/1')
+        pg = ixia.new_port_group()
+        pg.create()
+        pg.add_port(port)
+        pg.start_capture()
+        pg.start_transmit()
+        time.sleep(0.05)
+        pg.stop_transmit()
+        pg.stop_capture()
+        count = port.capture.n_packets
+        assert count > 100, count
+
+        ixia.session.capture_buffer_segment_size = 40
+        buf = ixia.new_capture_buffer(port)
+        eq_(buf.segment_size, 40)
+        sim.requests = 0
+        frames = list(buf.frames())
+        eq_(len(frames), count)
+        eq_(sim.requests, (count + 39) // 40)
+        eq_(frames[9].data[14:18], (10).to_bytes(4, 'big'))
+        eq_(len(list(buf.frames(count - 1, count + 10))), 2)
+
+
+def test_write_streams():
+    sim = simulator()
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        ixia.discover()
+        port = ixia.get_port('1/2/1')
+        sim.reset_counters()
+        streams = port.write_streams(
+                [dict(name='flow {%d}' % n, framesize=64 + n,
+                      percent_packet_rate=0.5) for n in range(100)])
+        eq_(sim.requests, 1)
+        eq_(sim.get_port(2, 1).writes, 1)
+        eq_(len(sim.get_port(2, 1).streams), 100)
+        eq_(streams[10].name, 'flow {10}')
+        eq_(streams[10].framesize, 74)
+        eq_(streams[10].percent_packet_rate, 0.5)
+        eq_(streams[10].num_frames, 100)
+
+
+def test_port_group_manager():
+    sim = simulator()
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        ixia.discover()
+        ixia.session.login('tester')
+        ports = ixia.get_ports(['1/1/1-4'])
+        sim.reset_counters()
+        pg = ixia.port_groups.get(ports)
+        eq_(sim.requests, 1)
+        for n in range(3):
+            ixia.port_groups.get(reversed(ports)).start_transmit()
+            ixia.port_groups.get(ports).stop_transmit()
+        eq_(sim.requests, 7)
+        eq_(sim.commands['portGroup create'], 1)
+        eq_(sim.commands['portGroup add'], 4)
+        other = ixia.port_groups.get(ports[:2])
+        assert other.id != pg.id
+        eq_(len(ixia.port_groups), 2)
+        sim.reset_counters()
+        ixia.disconnect()
+        eq_(sim.commands['portGroup destroy'], 2)
+        eq_(sim.requests, 2)
+
+
+def test_port_group_manager_errors():
+    sim = simulator()
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        ixia.discover()
+        card = ixia.chassis.cards[0]
+        try:
+            ixia.port_groups.get([card.ports[0], Port(ixia._api, card, 9)])
+        except IxTclHalError:
+            pass
+        else:
+            assert False
+        eq_(len(ixia.port_groups), 0)
+        eq_(sim.commands['portGroup destroy'], 1)
+
+        # a group which wasn't created by the manager is left alone
+        other = ixia.new_port_group()
+        other.create()
+        ixia.new_port_group(other.id + 1).create()
+        try:
+            ixia.port_groups.get(card.ports)
+        except IxTclHalError:
+            pass
+        else:
+            assert False
+        eq_(sim.commands['portGroup destroy'], 1)
+        other.destroy()
+        ixia.new_port_group(other.id + 1).destroy()
+
+        # the connection is closed, even if a group can't be destroyed
+        ixia.port_groups.get(card.ports).destroy()
+        try:
+            ixia.disconnect()
+        except IxTclHalError:
+            pass
+        else:
+            assert False
+        eq_(ixia._tcl.fd, None)
+
+
+def async_client(server):
+    (host, port) = server.server_address[:2]
+    return AsyncTclSocketClient(host, port)
+
+
+def test_async_api():
+    sim = simulator()
+
+    async def run(client):
+        api = AsyncIxTclHalApi(client)
+        await client.connect()
+        await api.call_rc('chassis add ixia')
+        await api.call('chassis config -id 1')
+        await api.call_rc('chassis set ixia')
+        port = Port(None, ixia.chassis.cards[0], 2)
+        values = await api.fetch([(port, [Port._ix_members['link_state']])])
+        eq_(values, [[1]])
+        results = await client.call_many(['set a 1', 'incr a', 'incr a'])
+        eq_([r[0] for r in results], ['1', '2', '3'])
+        try:
+            await api.call_rc('port get 1 1 9')
+        except IxTclHalError as e:
+            eq_(e.rc, 1)
+        else:
+            assert False
+        try:
+            await client.call('error oops')
+        except TclError as e:
+            eq_(e.result, 'oops')
+        else:
+            assert False
+        eq_(await client.hal_version(), ('6', '70'))
+        await client.close()
+
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        ixia.discover()
+        asyncio.run(run(async_client(server)))
+
+
+def test_async_connection_drop():
+    sim = simulator()
+
+    async def run(client):
+        await client.connect()
+        # a line without CR makes the simulator close the connection
+        client._writer.write(b'bogus\n')
+        pending = asyncio.ensure_future(client.call('info tclversion'))
+        try:
+            await asyncio.wait_for(pending, 5)
+        except EOFError:
+            pass
+        else:
+            assert False
+        # the reader is gone, later calls fail immediately
+        try:
+            await client.call('info tclversion')
+        except EOFError:
+            pass
+        else:
+            assert False
+        await client.close()
+
+    with sim.serve() as server:
+        asyncio.run(run(async_client(server)))
+
+
+def test_async_malformed_reply():
+    sim = simulator()
+
+    async def run(client):
+        await client.connect()
+        # the output contains the end of a reply
+        for script in ('puts -nonewline "ab\\r\\n"', 'info tclversion'):
+            try:
+                await asyncio.wait_for(client.call(script), 5)
+            except RuntimeError:
+                pass
+            else:
+                assert False
+        await client.close()
+
+    with sim.serve() as server:
+        asyncio.run(run(async_client(server)))
+
+
+def test_ssh_stdio():
+    sim = simulator()
+    client = TclSSHClient('ixia')
+    client._transport = sim.ssh_transport()
+    client.connect()
+    eq_(client.call('puts hello; list a\\nb c'), ('{a\nb} c', 'hello\n'))
+    eq_(client.call('chassis add ixia'), ('0', None))
+    try:
+        client.call('port cget -bogus')
+    except TclError:
+        pass
+    else:
+        assert False
+    client.close()
+
+
+class FakeSSHClient:
+    """Stands in for paramiko.SSHClient, its sessions are served by a
+    simulator."""
+    sim = None
+    log = list()
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, host, **kwargs):
+        self.log.append('connect %s' % host)
+
+    def get_transport(self):
+        return self.sim.ssh_transport()
+
+    def close(self):
+        self.log.append('close')
+
+
+def test_ssh_shared_transport():
+    FakeSSHClient.sim = simulator()
+    FakeSSHClient.log.clear()
+    paramiko = types.SimpleNamespace(SSHClient=FakeSSHClient,
+                                     AutoAddPolicy=lambda: None)
+    saved = sys.modules.get('paramiko')
+    sys.modules['paramiko'] = paramiko
+    try:
+        client = TclSSHClient('ixia')
+        channels = [client.channel(), client.channel()]
+        for c in channels:
+            c.connect()
+        eq_(FakeSSHClient.log, ['connect ixia'])
+        eq_(client._transport.users, 2)
+
+        # the peer goes away in the middle of a call
+        channels[0].fd._peer.shutdown(socket.SHUT_RDWR)
+        try:
+            channels[0].call('info tclversion')
+        except (OSError, EOFError):
+            pass
+        else:
+            assert False
+        assert channels[0].broken
+        eq_(channels[1].call('list a'), ('a', None))
+
+        for c in channels + channels:
+            c.close()
+        eq_(client._transport.users, 0)
+        eq_(FakeSSHClient.log, ['connect ixia', 'close'])
+    finally:
+        if saved is None:
+            del sys.modules['paramiko']
+        else:
+            sys.modules['paramiko'] = saved
+
+
+def test_tcl_error_is_transport_independent():
+    sim = simulator()
+    ssh = TclSSHClient('ixia')
+    ssh._transport = sim.ssh_transport()
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        for client in (ixia._tcl, ssh):
+            client.connect()
+            for (script, result) in (('error 3', 3), ('error oops', 'oops')):
+                try:
+                    client.call(script)
+                except TclError as e:
+                    eq_(e.result, result)
+                else:
+                    assert False
+            client.close()
+
+
+def test_unicode_round_trip():
+    sim = simulator()
+    ssh = TclSSHClient('ixia')
+    ssh._transport = sim.ssh_transport()
+    ssh.connect()
+    eq_(ssh.call('puts -nonewline café; list €'), ('€', 'café'))
+    ssh.close()
+
+    with sim.serve() as server:
+        ixia = Ixia(server.url)
+        ixia.connect()
+        ixia.discover()
+        port = ixia.get_port('1/1/1')
+        port.name = 'café €'
+        port.invalidate('name')
+        eq_(port.name, 'café €')
+        eq_(ixia._tcl.call('puts -nonewline é; list é'), ('é', 'é'))
+        assert not ixia._tcl.broken
+        ixia.disconnect()
+
+        async def run(client):
+            await client.connect()
+            eq_(await client.call('list café'), ('café', None))
+            await client.close()
+
+        asyncio.run(run(async_client(server)))
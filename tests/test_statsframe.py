@@ -0,0 +1,33 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+from unittest import SkipTest
+
+from pyixia import Port, StatsFrame
+from pyixia.ixapi import IxTclHalApi
+from pyixia.statsframe import numpy
+from nose.tools import eq_
+
+from test_ixapi import FakeTclHandler, FakeCard
+
+
+def test_stats_frame():
+    if numpy is None:
+        raise SkipTest('numpy is not installed')
+
+    tcl = FakeTclHandler('0 100 0 90 0 0 0 200 0 200 0 3',
+                         '0 150 0 130 0 0 0 200 0 210 0 4')
+    api = IxTclHalApi(tcl)
+    ports = [Port(api, FakeCard(), 1), Port(api, FakeCard(), 2)]
+    counters = ['frames_sent', 'frames_received', 'fcs_errors']
+    f1 = StatsFrame.fetch(api, ports, counters)
+    f2 = StatsFrame.fetch(api, ports, counters)
+    eq_(len(tcl.calls), 2)
+    eq_(f1.values.dtype, numpy.int64)
+    eq_(f1.port_ids.tolist(), [[1, 1, 1], [1, 1, 2]])
+    eq_(f2.delta(f1).tolist(), [[50, 40, 0], [0, 10, 1]])
+    eq_(f2.loss().tolist(), [20, -10])
+    eq_(f2.loss([(ports[0], (1, 1, 2))]).tolist(), [-60])
+    eq_(f2.errors().tolist(), [False, True])
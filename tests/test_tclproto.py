@@ -0,0 +1,118 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+from pyixia.tclproto import RecvBuffer, TclError, TclSocketClient
+from pyixia.tclproto import _parse_reply
+from nose.tools import eq_
+
+
+class FakeSocket:
+    def __init__(self, data, chunk_size):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def recv_into(self, buf):
+        n = min(len(buf), self.chunk_size, len(self.data))
+        buf[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+class FailingSocket(FakeSocket):
+    """Replies to every request with an empty result, fails to send the request
+    number `fail`."""
+    def __init__(self, fail):
+        super().__init__(b'', 4096)
+        self.fail = fail
+        self.sent = 0
+        self.closed = False
+
+    def sendall(self, data):
+        self.sent += 1
+        if self.sent == self.fail:
+            raise BrokenPipeError()
+        self.data += b'00\r\n'
+
+    def close(self):
+        self.closed = True
+
+
+def read_replies(data, chunk_size, size=16):
+    rx = RecvBuffer(FakeSocket(data, chunk_size), size)
+    replies = list()
+    while True:
+        try:
+            (start, end) = rx.read_until(b'\r\n')
+        except EOFError:
+            return replies
+        replies.append(_parse_reply(rx.buf, start, end))
+
+
+def test_recv_buffer():
+    data = b'00\r\nfoo\rbar0\r\n' + b'x' * 10000 + b'0\r\n11\r\n'
+    for chunk_size in (1, 2, 3, 7, 4096, len(data)):
+        replies = read_replies(data, chunk_size)
+        eq_(len(replies), 4)
+        eq_(replies[0], ('0', None))
+        eq_(replies[1], ('bar', 'foo'))
+        eq_(replies[2], ('x' * 10000, None))
+        eq_(type(replies[3]), TclError)
+        eq_(replies[3].result, 1)
+
+
+def test_call_many_breaks_connection_on_error():
+    client = TclSocketClient('ixia')
+    client.window = 2
+    client.fd = fd = FailingSocket(fail=4)
+    client._rx = RecvBuffer(fd)
+    try:
+        client.call_many(['info tclversion'] * 5)
+    except BrokenPipeError:
+        pass
+    else:
+        assert False
+    assert fd.closed
+    assert client.broken
+    try:
+        client.call('info tclversion')
+    except RuntimeError:
+        pass
+    else:
+        assert False
+
+
+def test_local_errors_keep_connection():
+    client = TclSocketClient('ixia')
+    client.fd = fd = FailingSocket(fail=0)
+    client._rx = RecvBuffer(fd)
+    for (cmd, args) in (('port config -name %s', ()),
+                        ('port config -name %s', ('\udc80',))):
+        try:
+            client.call(cmd, *args)
+        except (TypeError, UnicodeError):
+            pass
+        else:
+            assert False
+    try:
+        client.call_many(['info tclversion', ('%s %s', ('foo',))])
+    except TypeError:
+        pass
+    else:
+        assert False
+    eq_(fd.sent, 0)
+    assert not client.broken
+    eq_(client.call('info tclversion'), ('0', None))
+
+
+def test_recv_buffer_read_exactly():
+    rx = RecvBuffer(FakeSocket(b'5 abcdefgh', 3), 4)
+    (start, end) = rx.read_until(b' ')
+    eq_(bytes(rx.buf[start:end]), b'5 ')
+    (start, end) = rx.read_exactly(5)
+    eq_(bytes(rx.buf[start:end]), b'abcde')
+
+
+def test_parse_reply_utf8():
+    eq_(_parse_reply('é\r€0\r\n'.encode('utf-8')), ('€', 'é'))
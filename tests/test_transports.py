@@ -0,0 +1,50 @@
+# SPDX-License-Identifier: LGPL-2.0-or-later
+#
+# Copyright (c) 2015 Kontron Europe GmbH
+#
+
+import os.path
+import subprocess
+import sys
+
+from pyixia import Ixia
+from pyixia.tclproto import TclSocketClient
+from pyixia.transports import get_transport, parse_url, register_transport
+from nose.tools import eq_
+
+
+class FakeClient:
+    def __init__(self, host, port=None):
+        self.host = host
+        self.port = port
+
+
+def test_parse_url():
+    eq_(parse_url('10.0.0.1'), ('socket', '10.0.0.1', dict()))
+    eq_(parse_url('socket://ixia:4556'), ('socket', 'ixia', dict(port=4556)))
+    eq_(parse_url('ssh://ixia'), ('ssh', 'ixia', dict()))
+    eq_(parse_url('replay:///tmp/trace.gz'), ('replay', '/tmp/trace.gz',
+                                              dict()))
+
+
+def test_register_transport():
+    eq_(get_transport('socket'), TclSocketClient)
+    register_transport('fake', 'test_transports:FakeClient')
+    ixia = Ixia('fake://ixia:1234')
+    eq_(type(ixia._tcl).__name__, 'FakeClient')
+    eq_((ixia._tcl.host, ixia._tcl.port), ('ixia', 1234))
+    try:
+        Ixia('unknown://ixia')
+    except RuntimeError:
+        pass
+    else:
+        assert False
+
+
+def test_lazy_imports():
+    code = ('import sys, pyixia; '
+            'print(sorted(set(["asyncio", "paramiko", "numpy"]) & '
+            'set(sys.modules)))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+    eq_(out.strip(), b'[]')